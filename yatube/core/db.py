@@ -0,0 +1,147 @@
+"""Настройка соединений с базой.
+
+Каждому новому соединению SQLite выставляются PRAGMA из SQLITE_PRAGMAS:
+WAL дает читать во время записи, а synchronous=NORMAL в режиме WAL не
+теряет целостность и заметно ускоряет фиксацию. Ожидание блокировки
+вместо ошибки «database is locked» задает OPTIONS['timeout'] базы:
+драйвер sqlite3 сам выставляет по нему busy_timeout.
+
+Постоянные соединения (CONN_MAX_AGE) при DATABASE_HEALTH_CHECKS
+проверяются, как CONN_HEALTH_CHECKS в Django 4.1: перед первым
+обращением к базе в запросе, так что запросы без базы ничего не платят.
+Соединение, которое база успела закрыть, закрывается и у нас, и запрос
+откроет новое вместо ошибки.
+
+ReplicaRouter отправляет чтение в реплики DATABASE_REPLICAS только
+внутри replica_reads(): им обернуты ленты, остальной код читает из
+основной базы. Реплика выбирается одна на запрос, чтобы счетчик страниц
+и сами посты были согласованы. Чтобы автор сразу видел свой пост,
+запрос, который что-то записал, закрепляет браузер за основной базой
+на REPLICA_PIN_SECONDS (куки ставит core.middleware.ReplicaPinMiddleware);
+закрепленным запросам и кэш страниц не отдается. Остальные пользователи
+видят изменения с задержкой репликации. Сессии и пользователи всегда
+читаются из основной базы: только что вошедший пользователь мог еще не
+дойти до реплики. primary_reads() возвращает чтение в основную базу
+внутри replica_reads(), например, когда результат ляжет в общий кэш.
+"""
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+@receiver(request_started)
+def schedule_health_checks(**kwargs):
+    """Отмечает постоянные соединения для проверки при первом обращении."""
+    if not settings.DATABASE_HEALTH_CHECKS:
+        return
+    for connection in connections.all():
+        if (
+            connection.connection is not None
+            and connection.settings_dict['CONN_MAX_AGE']
+        ):
+            connection.health_check_pending = True
+
+
+def check_health(connection):
+    """Закрывает соединение, если база его уже закрыла."""
+    connection.health_check_pending = False
+    if (
+        connection.connection is not None
+        and not connection.in_atomic_block
+        and not connection.is_usable()
+    ):
+        connection.close()
+
+
+_ensure_connection = BaseDatabaseWrapper.ensure_connection
+
+
+def ensure_connection(self):
+    if getattr(self, 'health_check_pending', False):
+        check_health(self)
+    _ensure_connection(self)
+
+
+BaseDatabaseWrapper.ensure_connection = ensure_connection
+
+
+_routing = threading.local()
+
+
+def reset_routing(pinned=False):
+    _routing.pinned = pinned
+    _routing.wrote = False
+    _routing.replica = None
+
+
+def pinned():
+    """Читает ли текущий запрос только из основной базы."""
+    return bool(settings.DATABASE_REPLICAS) and (
+        getattr(_routing, 'pinned', False)
+        or getattr(_routing, 'wrote', False)
+    )
+
+
+def wrote():
+    return getattr(_routing, 'wrote', False)
+
+
+@contextmanager
+def replica_reads():
+    """Чтение из реплики внутри блока; годится и как декоратор view."""
+    previous = getattr(_routing, 'replica', None)
+    if previous is None and settings.DATABASE_REPLICAS and not pinned():
+        _routing.replica = random.choice(settings.DATABASE_REPLICAS)
+    try:
+        yield
+    finally:
+        _routing.replica = previous
+
+
+@contextmanager
+def primary_reads():
+    """Чтение из основной базы внутри блока, даже под replica_reads()."""
+    previous = getattr(_routing, 'replica', None)
+    _routing.replica = DEFAULT_DB_ALIAS
+    try:
+        yield
+    finally:
+        _routing.replica = previous
+
+
+PRIMARY_APPS = ('auth', 'sessions')
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if pinned() or model._meta.app_label in PRIMARY_APPS:
+            return None
+        return getattr(_routing, 'replica', None)
+
+    def db_for_write(self, model, **hints):
+        # После записи до конца запроса читаем только из основной базы.
+        _routing.wrote = True
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Схему реплики получают репликацией из основной базы.
+        return db not in settings.DATABASE_REPLICAS
@@ -0,0 +1,59 @@
+"""Пользовательские фрагменты («дыры») в страницах из общего кэша.
+
+Страница кэшируется один раз для всех, а то, что у каждого свое, —
+шапка с именем пользователя, форма комментария, кнопка подписки —
+вместо содержимого оставляет в закэшированной HTML-оболочке маркер
+<!--hole:имя:аргументы-->. fill() на каждом запросе, и при попадании,
+и при промахе, заменяет маркеры фрагментами, отрисованными для текущего
+пользователя. Подделать маркер текстом поста нельзя: автоэкранирование
+превращает «<» в «&lt;».
+
+Фрагмент регистрируется вместе с функцией, которая строит контекст
+шаблона по запросу и аргументам маркера (они приходят строками).
+"""
+import re
+from urllib.parse import parse_qsl, urlencode
+
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+HOLE_RE = re.compile(r'<!--hole:(\w+):([^>]*)-->')
+
+_holes = {}
+
+
+def register(name, template_name):
+    def decorator(get_context):
+        _holes[name] = (template_name, get_context)
+        return get_context
+    return decorator
+
+
+def punching(request):
+    """Отрисовывается ли сейчас оболочка для общего кэша."""
+    return getattr(request, 'punch_holes', False)
+
+
+def marker(name, kwargs):
+    return mark_safe(f'<!--hole:{name}:{urlencode(kwargs)}-->')
+
+
+def render(request, name, kwargs):
+    template_name, get_context = _holes[name]
+    return render_to_string(
+        template_name, get_context(request, **kwargs), request
+    )
+
+
+def fill(request, content):
+    return HOLE_RE.sub(
+        lambda match: render(
+            request, match.group(1), dict(parse_qsl(match.group(2)))
+        ),
+        content,
+    )
+
+
+@register('header', 'includes/header.html')
+def header_context(request):
+    return {}
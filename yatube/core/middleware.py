@@ -0,0 +1,177 @@
+"""Профилирование запросов: SQL, рендеринг шаблонов и миниатюры.
+
+Замеры отдаются в заголовке Server-Timing и видны во вкладке Network
+браузера. Профилирование включается настройкой PROFILING для всех
+запросов или заголовком PROFILING_HEADER для отдельного запроса
+сотрудника, в том числе при DEBUG. При PROFILING_CPROFILE_DIR доля
+PROFILING_SAMPLE_RATE профилируемых запросов дополнительно сохраняется
+в файлы cProfile (смотреть через snakeviz или pstats).
+"""
+import cProfile
+import os
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+from django.template.base import Template
+from django.utils import timezone
+from sorl.thumbnail.base import ThumbnailBackend
+
+from . import db
+
+_local = threading.local()
+_installed = False
+
+
+class RequestProfile:
+    def __init__(self):
+        self.queries = []
+        self.timings = Counter()
+        self.active = set()
+
+    def execute(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - started))
+
+    @property
+    def sql_time(self):
+        return sum(duration for sql, duration in self.queries)
+
+    @property
+    def duplicates(self):
+        """Сколько запросов повторяли уже выполненный SQL."""
+        return sum(
+            count - 1 for count in Counter(
+                sql for sql, duration in self.queries
+            ).values()
+        )
+
+    def server_timing(self, total):
+        metrics = [
+            ('sql', self.sql_time,
+             f'{len(self.queries)} queries / {self.duplicates} duplicate'),
+            ('render', self.timings['render'], 'templates'),
+            ('thumbnails', self.timings['thumbnails'], 'sorl-thumbnail'),
+            ('total', total, 'view'),
+        ]
+        return ', '.join(
+            f'{name};dur={duration * 1000:.1f};desc="{desc}"'
+            for name, duration, desc in metrics
+        )
+
+
+def timed(method, metric):
+    """Обертка, добавляющая время вызова к метрике текущего профиля.
+
+    Вложенные вызовы (include внутри шаблона) не считаются повторно.
+    """
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        profile = getattr(_local, 'profile', None)
+        if profile is None or metric in profile.active:
+            return method(*args, **kwargs)
+        profile.active.add(metric)
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            profile.timings[metric] += time.perf_counter() - started
+            profile.active.discard(metric)
+    return wrapper
+
+
+def install():
+    """Один раз оборачивает рендеринг шаблонов и генерацию миниатюр."""
+    global _installed
+    if not _installed:
+        Template.render = timed(Template.render, 'render')
+        ThumbnailBackend.get_thumbnail = timed(
+            ThumbnailBackend.get_thumbnail, 'thumbnails'
+        )
+        _installed = True
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        install()
+
+    def enabled(self, request):
+        if settings.PROFILING:
+            return True
+        if settings.PROFILING_HEADER not in request.headers:
+            return False
+        # Не только при DEBUG: профиль раскрывает SQL и тайминги.
+        return request.user.is_staff
+
+    def dump_path(self, request):
+        name = request.path.strip('/').replace('/', '-') or 'index'
+        stamp = timezone.now().strftime('%Y%m%d-%H%M%S-%f')
+        return os.path.join(
+            settings.PROFILING_CPROFILE_DIR, f'{stamp}-{name}.prof'
+        )
+
+    def __call__(self, request):
+        if not self.enabled(request):
+            return self.get_response(request)
+        profile = _local.profile = RequestProfile()
+        sample = (
+            settings.PROFILING_CPROFILE_DIR
+            and random.random() < settings.PROFILING_SAMPLE_RATE
+        )
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(profile.execute)
+                    )
+                if sample:
+                    profiler = cProfile.Profile()
+                    response = profiler.runcall(self.get_response, request)
+                    os.makedirs(settings.PROFILING_CPROFILE_DIR, exist_ok=True)
+                    profiler.dump_stats(self.dump_path(request))
+                else:
+                    response = self.get_response(request)
+        finally:
+            del _local.profile
+        response['Server-Timing'] = profile.server_timing(
+            time.perf_counter() - started
+        )
+        return response
+
+
+class ReplicaPinMiddleware:
+    """Закрепляет браузер за основной базой после записи (core.db).
+
+    Стоит перед SessionMiddleware, чтобы запись сессии при входе тоже
+    закрепляла.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        db.reset_routing(
+            pinned=settings.REPLICA_PIN_COOKIE in request.COOKIES
+        )
+        try:
+            response = self.get_response(request)
+            if settings.DATABASE_REPLICAS and db.wrote():
+                response.set_cookie(
+                    settings.REPLICA_PIN_COOKIE, '1',
+                    max_age=settings.REPLICA_PIN_SECONDS,
+                    httponly=True,
+                    samesite='Lax',
+                )
+        finally:
+            db.reset_routing()
+        return response
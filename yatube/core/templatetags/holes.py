@@ -0,0 +1,17 @@
+from django import template
+
+from core import holes
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def hole(context, name, **kwargs):
+    """Пользовательский фрагмент страницы (core.holes).
+
+    {% hole 'comment_form' post_id=post.id %}
+    """
+    request = context.get('request')
+    if holes.punching(request):
+        return holes.marker(name, kwargs)
+    return holes.render(request, name, kwargs)
@@ -0,0 +1,143 @@
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.db import connection, router
+from django.http import HttpResponse
+from django.test import (
+    RequestFactory, SimpleTestCase, TestCase, override_settings,
+)
+
+from posts.models import Post
+
+from ..db import (
+    check_health, ensure_connection, primary_reads, replica_reads,
+    schedule_health_checks,
+)
+from ..middleware import ReplicaPinMiddleware
+
+
+@skipUnless(connection.vendor == 'sqlite', 'PRAGMA есть только у SQLite')
+class SqlitePragmasTest(TestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_are_applied_on_connect(self):
+        """Соединение получает PRAGMA и ожидание блокировки из OPTIONS."""
+        timeout = settings.DATABASES['default']['OPTIONS']['timeout']
+        self.assertEqual(self.pragma('busy_timeout'), timeout * 1000)
+        # 1 — NORMAL.
+        self.assertEqual(self.pragma('synchronous'), 1)
+
+
+class HealthCheckTest(SimpleTestCase):
+    def fake_connection(self, usable, max_age=60, in_atomic_block=False):
+        return SimpleNamespace(
+            connection=object(),
+            settings_dict={'CONN_MAX_AGE': max_age},
+            in_atomic_block=in_atomic_block,
+            is_usable=mock.Mock(return_value=usable),
+            close=mock.Mock(),
+        )
+
+    def schedule(self, *fake_connections):
+        with mock.patch('core.db.connections') as connections:
+            connections.all.return_value = fake_connections
+            schedule_health_checks()
+
+    def test_request_start_only_marks_persistent_connections(self):
+        """Начало запроса только отмечает соединения, не обращаясь к базе."""
+        persistent = self.fake_connection(usable=True)
+        short = self.fake_connection(usable=True, max_age=0)
+        self.schedule(persistent, short)
+        self.assertTrue(persistent.health_check_pending)
+        self.assertFalse(hasattr(short, 'health_check_pending'))
+        persistent.is_usable.assert_not_called()
+
+    def test_broken_connection_is_closed_on_first_use(self):
+        """Перед первым обращением закрывается только мертвое соединение."""
+        broken = self.fake_connection(usable=False)
+        alive = self.fake_connection(usable=True)
+        self.schedule(broken, alive)
+        with mock.patch('core.db._ensure_connection') as connect:
+            ensure_connection(broken)
+            ensure_connection(alive)
+            ensure_connection(broken)
+        broken.close.assert_called_once()
+        alive.close.assert_not_called()
+        self.assertEqual(connect.call_count, 3)
+
+    def test_atomic_connection_is_kept(self):
+        """Соединение внутри транзакции не закрывается."""
+        atomic = self.fake_connection(usable=False, in_atomic_block=True)
+        check_health(atomic)
+        atomic.close.assert_not_called()
+
+    @override_settings(DATABASE_HEALTH_CHECKS=False)
+    def test_checks_can_be_disabled(self):
+        """При DATABASE_HEALTH_CHECKS=False соединения не проверяются."""
+        broken = self.fake_connection(usable=False)
+        self.schedule(broken)
+        self.assertFalse(hasattr(broken, 'health_check_pending'))
+
+
+def read_view(request):
+    with replica_reads():
+        return HttpResponse(router.db_for_read(Post))
+
+
+def write_view(request):
+    router.db_for_write(Post)
+    return read_view(request)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTest(SimpleTestCase):
+    def get(self, view, **cookies):
+        request = RequestFactory().get('/')
+        request.COOKIES.update(cookies)
+        return ReplicaPinMiddleware(view)(request)
+
+    def test_only_wrapped_reads_go_to_replica(self):
+        """В реплику идут только чтения внутри replica_reads()."""
+        response = self.get(read_view)
+        self.assertEqual(response.content, b'replica')
+        self.assertNotIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+        self.assertEqual(router.db_for_read(Post), 'default')
+
+    def test_write_pins_browser_to_primary(self):
+        """После записи браузер закрепляется за основной базой."""
+        response = self.get(write_view)
+        self.assertEqual(response.content, b'default')
+        cookie = response.cookies[settings.REPLICA_PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.REPLICA_PIN_SECONDS)
+        response = self.get(
+            read_view, **{settings.REPLICA_PIN_COOKIE: cookie.value}
+        )
+        self.assertEqual(response.content, b'default')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_nothing_is_pinned(self):
+        """Без реплик кука закрепления не ставится."""
+        response = self.get(write_view)
+        self.assertEqual(response.content, b'default')
+        self.assertNotIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+
+    def test_sessions_and_users_are_read_from_primary(self):
+        """Сессии и пользователи читаются из основной базы и под репликой."""
+        with replica_reads():
+            self.assertEqual(router.db_for_read(Post), 'replica')
+            self.assertEqual(router.db_for_read(Session), 'default')
+            self.assertEqual(router.db_for_read(get_user_model()), 'default')
+
+    def test_primary_reads_inside_replica_reads(self):
+        """primary_reads() возвращает чтение в основную базу до выхода."""
+        with replica_reads():
+            with primary_reads():
+                with replica_reads():
+                    self.assertEqual(router.db_for_read(Post), 'default')
+            self.assertEqual(router.db_for_read(Post), 'replica')
@@ -0,0 +1,90 @@
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from posts.models import Post
+
+from ..middleware import RequestProfile
+
+User = get_user_model()
+TEMP_PROFILE_DIR = tempfile.mkdtemp()
+
+
+def parse_server_timing(header):
+    metrics = {}
+    for entry in header.split(', '):
+        name, duration, desc = entry.split(';')
+        metrics[name] = (
+            float(duration.split('=')[1]), desc.split('=')[1].strip('"')
+        )
+    return metrics
+
+
+class ProfilingMiddlewareTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.staff = User.objects.create_user(username='staff', is_staff=True)
+        Post.objects.create(author=cls.user, text='Тестовый пост')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_PROFILE_DIR, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_disabled_by_default(self):
+        """Без настройки и заголовка Server-Timing не отдается."""
+        response = self.client.get(reverse('posts:index'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    def test_header_is_ignored_for_regular_users(self):
+        """Обычный пользователь не включает профиль заголовком."""
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('posts:index'), HTTP_X_PROFILE='1')
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    @override_settings(DEBUG=True)
+    def test_header_is_ignored_for_anonymous_in_debug(self):
+        """Даже при DEBUG аноним не получает профиль по заголовку."""
+        response = self.client.get(reverse('posts:index'), HTTP_X_PROFILE='1')
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    def test_staff_header_reports_sql_and_render(self):
+        """Сотрудник по заголовку получает замеры SQL и рендеринга."""
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('posts:index'), HTTP_X_PROFILE='1')
+        metrics = parse_server_timing(response['Server-Timing'])
+        self.assertEqual(
+            set(metrics), {'sql', 'render', 'thumbnails', 'total'}
+        )
+        self.assertRegex(
+            metrics['sql'][1], r'^[1-9]\d* queries / \d+ duplicate$'
+        )
+        self.assertGreater(metrics['render'][0], 0)
+        self.assertGreaterEqual(metrics['total'][0], metrics['render'][0])
+
+    def test_duplicate_queries_are_counted(self):
+        """Повторы одного и того же SQL считаются дубликатами."""
+        profile = RequestProfile()
+        for sql in ['SELECT 1', 'SELECT 2', 'SELECT 1', 'SELECT 1']:
+            profile.execute(lambda *args: None, sql, (), False, {})
+        self.assertEqual(len(profile.queries), 4)
+        self.assertEqual(profile.duplicates, 2)
+
+    @override_settings(PROFILING=True, PROFILING_CPROFILE_DIR=TEMP_PROFILE_DIR,
+                       PROFILING_SAMPLE_RATE=1.0)
+    def test_sampled_request_is_dumped(self):
+        """Попавший в выборку запрос сохраняется в файл cProfile."""
+        self.client.get(reverse('posts:index'))
+        dumps = os.listdir(TEMP_PROFILE_DIR)
+        self.assertEqual(len(dumps), 1)
+        self.assertTrue(dumps[0].endswith('-index.prof'))
@@ -14,7 +14,7 @@ class PostAdmin(admin.ModelAdmin):
 
 @admin.register(Group)
 class GroupAdmin(admin.ModelAdmin):
-    list_display = ('title', 'slug', 'description',)
+    list_display = ('title', 'slug', 'description', 'posts_count',)
     search_fields = ('title',)
 
 
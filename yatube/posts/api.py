@@ -0,0 +1,174 @@
+"""JSON API только для чтения: ленты и пост для мобильного клиента.
+
+Ленты отдаются курсорными страницами тех же querysets, что и HTML-views.
+ETag складывается из поколений областей кэша (posts.caching) и даты
+самого нового поста, поэтому на условный запрос без изменений отвечаем
+304, ничего не выбирая и не сериализуя. Last-Modified не отдается:
+правки и удаления не двигают дату, и If-Modified-Since получил бы 304
+на измененную ленту.
+"""
+from functools import wraps
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.views.decorators.http import require_GET
+
+from core.db import replica_reads
+
+from . import timeline
+from .caching import conditional, newest_pub_date, post_modified
+from .models import FEED_FIELDS, Group, Post, User
+from .utils import CursorPaginator, paginate
+
+
+def api_login_required(view_func):
+    """Как login_required, но вместо редиректа на форму входа — 401."""
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse(
+                {'detail': 'Требуется авторизация.'}, status=401
+            )
+        return view_func(request, *args, **kwargs)
+    return wrapper
+
+
+def serialize_post(post):
+    return {
+        'id': post.pk,
+        'text': post.text,
+        'pub_date': post.pub_date.isoformat(),
+        'author': {
+            'username': post.author.username,
+            'full_name': post.author.get_full_name(),
+        },
+        'group': post.group.slug if post.group_id else None,
+        'image': post.image.url if post.image else None,
+        'comment_count': getattr(post, 'comment_count', None),
+        'url': reverse('posts:post_detail', kwargs={'post_id': post.pk}),
+    }
+
+
+def serialize_comment(comment):
+    return {
+        'id': comment.pk,
+        'author': comment.author.username,
+        'text': comment.text,
+        'created': comment.created.isoformat(),
+    }
+
+
+def cursor_links(request, page_obj):
+    links = {}
+    for name, cursor in (
+        ('next', page_obj.next_cursor),
+        ('previous', page_obj.previous_cursor),
+    ):
+        links[name] = (
+            f'{request.path}?cursor={cursor}' if cursor is not None else None
+        )
+    return links
+
+
+def feed_response(request, post_list, **extra):
+    # Ленты HTML обходятся началом текста, API отдает его целиком.
+    post_list = post_list.only('text', *FEED_FIELDS)
+    page_obj = paginate(post_list, request, cursor=True)['page_obj']
+    data = dict(extra)
+    data['results'] = [serialize_post(post) for post in page_obj]
+    data.update(cursor_links(request, page_obj))
+    return JsonResponse(data, json_dumps_params={'ensure_ascii': False})
+
+
+@require_GET
+@replica_reads()
+@conditional(
+    lambda request: ['index'],
+    lambda request: newest_pub_date(Post.objects.all()),
+    last_modified=False,
+)
+def index(request):
+    return feed_response(request, Post.objects.feed())
+
+
+@require_GET
+@replica_reads()
+@conditional(
+    lambda request, slug: [f'group:{slug}'],
+    lambda request, slug: newest_pub_date(
+        Post.objects.filter(group__slug=slug)
+    ),
+    last_modified=False,
+)
+def group_posts(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return feed_response(
+        request,
+        group.posts.feed(),
+        group={
+            'title': group.title,
+            'slug': group.slug,
+            'description': group.description,
+        },
+    )
+
+
+@require_GET
+@replica_reads()
+@conditional(
+    lambda request, username: [f'profile:{username}'],
+    lambda request, username: newest_pub_date(
+        Post.objects.filter(author__username=username)
+    ),
+    last_modified=False,
+)
+def profile(request, username):
+    author = get_object_or_404(User, username=username)
+    return feed_response(
+        request,
+        author.posts.feed(),
+        author={
+            'username': author.username,
+            'full_name': author.get_full_name(),
+        },
+    )
+
+
+@require_GET
+@api_login_required
+@replica_reads()
+@conditional(
+    # Лента подписок меняется вместе с любым постом ('index') и с
+    # подписками пользователя (они сбрасывают его профиль).
+    lambda request: ['index', f'profile:{request.user.username}'],
+    lambda request: newest_pub_date(timeline.feed(request.user)),
+    per_user=True,
+    last_modified=False,
+)
+def follow_index(request):
+    return feed_response(request, timeline.feed(request.user))
+
+
+@require_GET
+@replica_reads()
+@conditional(
+    lambda request, post_id: [f'post:{post_id}'],
+    post_modified,
+    last_modified=False,
+)
+def post_detail(request, post_id):
+    post = get_object_or_404(
+        Post.objects.feed().only('text', *FEED_FIELDS), pk=post_id
+    )
+    paginator = CursorPaginator(
+        post.comments.select_related('author'),
+        settings.COMMENTS_PER_PAGE,
+        date_field='created',
+    )
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+    data = serialize_post(post)
+    data['comments'] = [serialize_comment(comment) for comment in page_obj]
+    data.update(cursor_links(request, page_obj))
+    return JsonResponse(data, json_dumps_params={'ensure_ascii': False})
@@ -0,0 +1,208 @@
+"""Замеры задержки и числа запросов на страницах yatube.
+
+Запросы выполняются тестовым клиентом Django в том же процессе, поэтому
+сеть и WSGI-сервер в замер не входят: видно именно время view, шаблонов
+и базы. Каждый замер идет дважды: с пустым кэшем (cold) и повторно
+с прогретым (warm). Прогрев повторяет запрос PAGE_CACHE_ADMIT_AFTER раз:
+иначе страницы, которые кэш допускает не сразу (дальние страницы лент,
+страница поста), так и не попали бы в него.
+"""
+import pickle
+import statistics
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .feed import FeedRows, PostRow
+from .models import Comment, Follow, Group, Post, User
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    index = min(int(len(ordered) * share), len(ordered) - 1)
+    return ordered[index]
+
+
+def summarize(timings, queries=None):
+    """p50/p95/среднее в миллисекундах и, если даны, число запросов."""
+    summary = {
+        'p50_ms': round(percentile(timings, 0.5) * 1000, 2),
+        'p95_ms': round(percentile(timings, 0.95) * 1000, 2),
+        'mean_ms': round(statistics.mean(timings) * 1000, 2),
+    }
+    if queries is not None:
+        summary['queries_p50'] = percentile(queries, 0.5)
+        summary['queries_max'] = max(queries)
+    return summary
+
+
+class ViewBenchmark:
+    """Гоняет запросы к страницам на случайных, но воспроизводимых данных."""
+    SAMPLE_SIZE = 200
+
+    def __init__(self, rng, requests):
+        self.rng = rng
+        self.requests = requests
+        self.client = Client()
+        self.slugs = self.sample(Group.objects.values_list('slug', flat=True))
+        self.usernames = self.sample(
+            User.objects.filter(stats__posts_count__gt=0).values_list(
+                'username', flat=True
+            )
+        )
+        self.post_ids = self.sample(Post.objects.values_list('pk', flat=True))
+        self.followers = self.sample(
+            User.objects.filter(stats__following_count__gt=0)
+        )
+        self.commenters = self.sample(User.objects.all())
+
+    def sample(self, queryset):
+        # Случайные строки через ORDER BY RANDOM() на больших таблицах
+        # дороги, поэтому берем их по случайным смещениям.
+        total = queryset.count()
+        if not total:
+            return []
+        offsets = sorted(self.rng.sample(
+            range(total), min(total, self.SAMPLE_SIZE)
+        ))
+        return [queryset.order_by('pk')[offset] for offset in offsets]
+
+    def targets(self):
+        """Имя view, функция запроса, режимы и данные для замера.
+
+        Если данных нет (например, ни одной группы), view пропускается.
+        """
+        both = ('cold', 'warm')
+        return [
+            ('index', self.index, both, True),
+            ('group_posts', self.group_posts, both, self.slugs),
+            ('profile', self.profile, both, self.usernames),
+            ('post_detail', self.post_detail, both, self.post_ids),
+            ('follow_index', self.follow_index, both, self.followers),
+            ('add_comment', self.add_comment, ('cold',), self.post_ids),
+        ]
+
+    def index(self):
+        page = self.rng.randint(1, 5)
+        return self.client.get, reverse('posts:index'), {'page': page}
+
+    def group_posts(self):
+        url = reverse(
+            'posts:group_posts', kwargs={'slug': self.rng.choice(self.slugs)}
+        )
+        return self.client.get, url, {}
+
+    def profile(self):
+        url = reverse(
+            'posts:profile',
+            kwargs={'username': self.rng.choice(self.usernames)},
+        )
+        return self.client.get, url, {}
+
+    def post_detail(self):
+        url = reverse(
+            'posts:post_detail',
+            kwargs={'post_id': self.rng.choice(self.post_ids)},
+        )
+        return self.client.get, url, {}
+
+    def follow_index(self):
+        self.client.force_login(self.rng.choice(self.followers))
+        return self.client.get, reverse('posts:follow_index'), {}
+
+    def add_comment(self):
+        self.client.force_login(self.rng.choice(self.commenters))
+        url = reverse(
+            'posts:add_comment',
+            kwargs={'post_id': self.rng.choice(self.post_ids)},
+        )
+        return self.client.post, url, {'text': 'Замер'}
+
+    def timed(self, method, url, data):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = method(url, data)
+            elapsed = time.perf_counter() - started
+        if response.status_code >= 400:
+            raise RuntimeError(f'{url}: ответ {response.status_code}')
+        return elapsed, len(queries)
+
+    def measure(self, request, modes):
+        results = {}
+        for mode in modes:
+            timings = []
+            queries = []
+            for _ in range(self.requests):
+                self.client.logout()
+                method, url, data = request()
+                cache.clear()
+                if mode == 'warm':
+                    for _ in range(settings.PAGE_CACHE_ADMIT_AFTER):
+                        self.timed(method, url, data)
+                elapsed, count = self.timed(method, url, data)
+                timings.append(elapsed)
+                queries.append(count)
+            results[mode] = summarize(timings, queries)
+        return results
+
+    def run(self, views=None):
+        report = {}
+        for name, request, modes, data in self.targets():
+            if not data or (views and name not in views):
+                continue
+            report[name] = self.measure(request, modes)
+        return report
+
+
+def dataset_size():
+    return {
+        model._meta.model_name: model.objects.count()
+        for model in (User, Group, Post, Comment, Follow)
+    }
+
+
+def feed_page_loaders():
+    """Страница ленты экземплярами модели и строками PostRow.
+
+    Каждый загрузчик возвращает готовые объекты и то, что попало бы
+    в кэш. Кэш строк обходится, чтобы замерять выборку и сборку.
+    """
+    def models(start, stop):
+        page = list(Post.objects.feed()[start:stop])
+        return page, page
+
+    def rows(start, stop):
+        packed = FeedRows(Post.objects.feed(), 'benchmark', []).fetch(
+            start, stop
+        )
+        return [PostRow(*values) for values in packed], packed
+
+    return {'models': models, 'rows': rows}
+
+
+def measure_feed_pages(load, starts, per_page):
+    """CPU и память на страницу ленты для загрузчика load."""
+    timings = []
+    for start in starts:
+        started = time.perf_counter()
+        load(start, start + per_page)
+        timings.append(time.perf_counter() - started)
+    sizes = []
+    cached = []
+    for start in starts:
+        tracemalloc.start()
+        page, for_cache = load(start, start + per_page)
+        sizes.append(tracemalloc.get_traced_memory()[0])
+        tracemalloc.stop()
+        cached.append(len(pickle.dumps(for_cache)))
+        del page, for_cache
+    summary = summarize(timings)
+    summary['kib_per_page'] = round(statistics.mean(sizes) / 1024, 1)
+    summary['cached_kib_per_page'] = round(statistics.mean(cached) / 1024, 1)
+    return summary
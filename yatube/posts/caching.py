@@ -0,0 +1,404 @@
+"""Кэш страниц с поколениями вместо короткого TTL.
+
+Каждая кэшируемая страница зависит от одной или нескольких областей
+(например, 'index' или 'group:<slug>'). Номер поколения области входит
+в ключ кэша, и при изменении постов, комментариев или подписок сигналы
+увеличивают его: старые записи просто перестают находиться и вытесняются
+бэкендом сами.
+
+Страницы (cache_page_versioned) хранятся по одной записи на URL вместе
+с поколениями, при которых отрисованы. Запись свежая, пока поколения те
+же и не прошел мягкий TTL; устаревшую перестраивает один запрос под
+блокировкой, а остальные до жесткого TTL получают старую версию, вместо
+того чтобы разом идти в базу.
+
+Если настроены реплики, смена поколения на REPLICA_PIN_SECONDS отмечает
+область как недавно измененную: все, что ляжет в кэш под новым
+поколением, в это время читается из основной базы (fresh_reads), иначе
+запрос, попавший на отстающую реплику, закэшировал бы старые данные.
+"""
+import hashlib
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from functools import partial, wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max
+from django.http import HttpResponse
+from django.utils.http import quote_etag
+from django.views.decorators.http import condition
+
+from core import holes
+from core.db import pinned, primary_reads
+
+from .models import Group, Post, User
+from .utils import page_key
+
+GENERATION_KEY = 'posts:generation:{}'
+NEWEST_KEY = 'posts:newest:{}'
+BUMPED_KEY = 'posts:bumped:{}'
+AUTHOR_KEY = 'posts:author:{}'
+PAGE_KEY = '{}:{}'
+LOCK_KEY = 'posts:lock:{}'
+ADMIT_KEY = 'posts:admit:{}'
+ADMITTED = 'admitted'
+PAGE_STATS_KEY = 'posts:page_stats:{}:{}'
+PAGE_OUTCOMES = ('hits', 'misses', 'stale', 'waits', 'rejected', 'evicted')
+
+
+def get_generation(scope):
+    key = GENERATION_KEY.format(scope)
+    generation = cache.get(key)
+    if generation is None:
+        # Начинаем со времени, а не с единицы: если ключ поколения был
+        # вытеснен, старые страницы с тем же номером не оживут.
+        cache.add(key, int(time.time() * 1000), None)
+        generation = cache.get(key)
+    return generation
+
+
+def bump_generation(*scopes):
+    if settings.DATABASE_REPLICAS:
+        # Отметка ставится до смены поколения: кто увидит новое
+        # поколение, увидит и ее.
+        cache.set_many(
+            {BUMPED_KEY.format(scope): 1 for scope in scopes},
+            settings.REPLICA_PIN_SECONDS,
+        )
+    for scope in scopes:
+        key = GENERATION_KEY.format(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, int(time.time() * 1000), None)
+
+
+@contextmanager
+def fresh_reads(scopes):
+    """Читает из основной базы, если какая-то из областей менялась
+    последние REPLICA_PIN_SECONDS: реплика могла еще отставать."""
+    if settings.DATABASE_REPLICAS and cache.get_many(
+        [BUMPED_KEY.format(scope) for scope in scopes]
+    ):
+        with primary_reads():
+            yield
+    else:
+        yield
+
+
+def group_scope(group_id):
+    slug = Group.objects.filter(pk=group_id).values_list(
+        'slug', flat=True
+    ).first()
+    return [f'group:{slug}'] if slug is not None else []
+
+
+def profile_scope(user_id):
+    username = User.objects.filter(pk=user_id).values_list(
+        'username', flat=True
+    ).first()
+    return [f'profile:{username}'] if username is not None else []
+
+
+def post_author_scope(post_id):
+    """Область профиля автора поста: страница поста показывает число
+    его постов. Автор у поста не меняется, поэтому имя кэшируется."""
+    username = cache.get_or_set(
+        AUTHOR_KEY.format(post_id),
+        lambda: User.objects.filter(posts__pk=post_id).values_list(
+            'username', flat=True
+        ).first(),
+        settings.PAGE_CACHE_HARD_TIMEOUT,
+    )
+    return f'profile:{username}' if username else f'post:{post_id}'
+
+
+def post_scopes(post):
+    """Области кэша страниц, на которых виден пост."""
+    scopes = ['index', f'post:{post.pk}'] + profile_scope(post.author_id)
+    group_ids = {post.group_id, getattr(post, '_stored_group_id', None)}
+    for group_id in group_ids - {None}:
+        scopes += group_scope(group_id)
+    return scopes
+
+
+def bump_post_pages(post_id):
+    post = Post.objects.filter(pk=post_id).only('author', 'group').first()
+    if post is not None:
+        bump_generation(*post_scopes(post))
+
+
+def increment(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def page_cache_stats(key_prefix):
+    """Сколько раз страница отдана свежей, перестроена, отдана
+    устаревшей, дождалась перестройки другим запросом, не допущена в
+    кэш и сколько допущенных страниц кэш вытеснил раньше срока."""
+    keys = {
+        outcome: PAGE_STATS_KEY.format(key_prefix, outcome)
+        for outcome in PAGE_OUTCOMES
+    }
+    values = cache.get_many(keys.values())
+    return {outcome: values.get(key, 0) for outcome, key in keys.items()}
+
+
+class Revalidation:
+    """Блокировка перестройки записи: в процессе и между процессами.
+
+    Сначала неблокирующая блокировка потоков процесса, чтобы лишний раз
+    не ходить в кэш, затем cache.add, который атомарен для общих
+    бэкендов. Блокировка в кэше истекает сама через
+    PAGE_CACHE_LOCK_TIMEOUT, если перестраивавший процесс упал.
+    """
+    _locks = weakref.WeakValueDictionary()
+    _locks_guard = threading.Lock()
+
+    def __init__(self, key):
+        self.key = LOCK_KEY.format(key)
+        with self._locks_guard:
+            self.lock = self._locks.get(key)
+            if self.lock is None:
+                self.lock = self._locks[key] = threading.Lock()
+
+    def acquire(self):
+        if not self.lock.acquire(blocking=False):
+            return False
+        if cache.add(self.key, 1, settings.PAGE_CACHE_LOCK_TIMEOUT):
+            return True
+        self.lock.release()
+        return False
+
+    def release(self):
+        cache.delete(self.key)
+        self.lock.release()
+
+
+def shell_key(key_prefix, request, cursor=None):
+    """Ключ страницы: путь и номер страницы, как его поймет paginate.
+
+    Прочие параметры запроса в ключ не входят, так что '?page=01',
+    '?page=1&utm_source=x' и '/' — одна запись.
+    """
+    url = hashlib.md5(f'{request.path}?{page_key(request, cursor)}'.encode())
+    return PAGE_KEY.format(key_prefix, url.hexdigest())
+
+
+def admit(key, always, count):
+    """Допускать ли отрисованную страницу в кэш.
+
+    Чтобы обход краулером не вытеснял полезные записи, страница
+    попадает в кэш, только если ее запросили PAGE_CACHE_ADMIT_AFTER раз
+    за PAGE_CACHE_ADMIT_WINDOW секунд. Допущенной странице ставится
+    отметка до жесткого TTL: если записи нет, а отметка есть, запись
+    вытеснена, и страница допускается сразу.
+    """
+    admit_key = ADMIT_KEY.format(key)
+    seen = cache.get(admit_key)
+    if seen == ADMITTED:
+        count('evicted')
+        return True
+    if always:
+        return True
+    if seen is None:
+        cache.add(admit_key, 0, settings.PAGE_CACHE_ADMIT_WINDOW)
+    try:
+        seen = cache.incr(admit_key)
+    except ValueError:
+        return False
+    return seen >= settings.PAGE_CACHE_ADMIT_AFTER
+
+
+def render_shell(view_func, request, key, generations, timeout,
+                 args, kwargs, scopes=(), store=True):
+    """Отрисовывает страницу с маркерами вместо фрагментов и кэширует."""
+    request.punch_holes = True
+    try:
+        with fresh_reads(scopes):
+            response = view_func(request, *args, **kwargs)
+    finally:
+        request.punch_holes = False
+    if response.status_code != 200 or response.streaming:
+        return response
+    content = response.content.decode(response.charset)
+    if store:
+        hard_timeout = max(settings.PAGE_CACHE_HARD_TIMEOUT, timeout)
+        cache.set_many({
+            key: (generations, content, response['Content-Type'],
+                  time.time() + timeout),
+            ADMIT_KEY.format(key): ADMITTED,
+        }, hard_timeout)
+    response.content = holes.fill(request, content)
+    return response
+
+
+def shell_response(request, entry, stale=False):
+    generations, content, content_type, fresh_until = entry
+    response = HttpResponse(
+        holes.fill(request, content), content_type=content_type
+    )
+    if stale:
+        # Свой ETag, чтобы условный запрос после перестройки не получил
+        # 304 на устаревшую страницу.
+        response['ETag'] = quote_etag(
+            'stale-' + hashlib.md5(content.encode()).hexdigest()
+        )
+    return response
+
+
+def wait_for_shell(key, generations):
+    deadline = time.monotonic() + settings.PAGE_CACHE_LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None and entry[0] == generations:
+            return entry
+    return None
+
+
+def revalidate(request, key, generations, entry, render, count):
+    """Перестраивает устаревшую страницу, если никто другой этого не делает.
+
+    Иначе отдает прежнюю версию, а без нее ждет чужую перестройку.
+    """
+    revalidation = Revalidation(key)
+    if revalidation.acquire():
+        try:
+            count('misses')
+            return render()
+        finally:
+            revalidation.release()
+    if entry is not None:
+        count('stale')
+        return shell_response(request, entry, stale=True)
+    entry = wait_for_shell(key, generations)
+    if entry is not None:
+        count('waits')
+        return shell_response(request, entry)
+    # Другой запрос не успел: строим сами.
+    count('misses')
+    return render()
+
+
+def cache_page_versioned(timeout, key_prefix, *scopes, cursor=None,
+                         admit_first_page=True):
+    """Общий для всех кэш страницы, устаревающий по поколениям scopes.
+
+    Области могут ссылаться на аргументы view: 'group:{slug}', или
+    быть функциями от них, как post_author_scope.
+    timeout — мягкий TTL, жесткий задает PAGE_CACHE_HARD_TIMEOUT.
+    cursor — как в paginate: какой параметр выбирает страницу.
+    Первые страницы лент допускаются в кэш сразу (admit_first_page),
+    остальные — по частоте запросов (admit).
+    В отличие от cache_page, ключ не зависит от куки: в кэш попадает
+    HTML-оболочка с маркерами пользовательских фрагментов (core.holes),
+    которые заполняются на каждом запросе.
+    Запросы, закрепленные за основной базой, кэш минуют, а страницы
+    недавно измененных областей отрисовываются из нее (fresh_reads).
+    """
+    def count(outcome):
+        increment(PAGE_STATS_KEY.format(key_prefix, outcome))
+
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if pinned() or request.method not in ('GET', 'HEAD'):
+                return view_func(request, *args, **kwargs)
+            view_scopes = [
+                scope(**kwargs) if callable(scope) else scope.format(**kwargs)
+                for scope in scopes
+            ]
+            generations = '.'.join(
+                str(get_generation(scope)) for scope in view_scopes
+            )
+            key = shell_key(key_prefix, request, cursor)
+            entry = cache.get(key)
+            if (
+                entry is not None
+                and entry[0] == generations
+                and time.time() < entry[3]
+            ):
+                count('hits')
+                return shell_response(request, entry)
+            render = partial(render_shell, view_func, request, key,
+                             generations, timeout, args, kwargs,
+                             view_scopes)
+            first_page = admit_first_page and not page_key(request, cursor)
+            if entry is None and not admit(key, first_page, count):
+                count('rejected')
+                return render(store=False)
+            return revalidate(request, key, generations, entry, render, count)
+        return wrapper
+    return decorator
+
+
+def newest_pub_date(posts):
+    return posts.order_by('-pub_date').values_list(
+        'pub_date', flat=True
+    ).first()
+
+
+def post_modified(request, post_id):
+    """Дата поста или его последнего комментария, если он новее."""
+    dates = Post.objects.filter(pk=post_id).order_by().annotate(
+        last_comment=Max('comments__created')
+    ).values_list('pub_date', 'last_comment').first()
+    return max(filter(None, dates or ()), default=None)
+
+
+def conditional(scopes, newest, per_user=False, last_modified=True):
+    """Условный GET: ETag из поколений областей и даты изменения.
+
+    scopes(request, **kwargs) возвращает области, от которых зависит
+    ответ, newest(request, **kwargs) — дату последнего изменения или None.
+    Правки и удаления не двигают дату, но увеличивают поколение, поэтому
+    ETag меняется и от них. При неизменных поколениях дата тоже не
+    меняется, так что она кэшируется под ними и повторные запросы
+    обходятся без базы.
+    per_user добавляет в ETag пользователя для страниц, которые у
+    каждого свои; таким страницам не стоит отдавать Last-Modified:
+    If-Modified-Since не отличает одного пользователя от другого.
+    """
+    def get_scopes(request, **kwargs):
+        if not hasattr(request, '_scopes'):
+            request._scopes = list(scopes(request, **kwargs))
+        return request._scopes
+
+    def get_generations(request, **kwargs):
+        if not hasattr(request, '_generations'):
+            request._generations = '.'.join(
+                f'{scope}={get_generation(scope)}'
+                for scope in get_scopes(request, **kwargs)
+            )
+        return request._generations
+
+    def get_newest(request, **kwargs):
+        if not hasattr(request, '_newest_change'):
+            key = NEWEST_KEY.format(get_generations(request, **kwargs))
+            with fresh_reads(get_scopes(request, **kwargs)):
+                # Список, чтобы отличать закэшированное None от промаха.
+                request._newest_change = cache.get_or_set(
+                    key, lambda: [newest(request, **kwargs)]
+                )[0]
+        return request._newest_change
+
+    def etag(request, **kwargs):
+        generations = get_generations(request, **kwargs)
+        modified = get_newest(request, **kwargs)
+        state = f'{generations}|{modified.isoformat() if modified else ""}'
+        if per_user:
+            state += f'|{request.user.pk}'
+        return hashlib.md5(state.encode()).hexdigest()
+
+    return condition(
+        etag_func=etag,
+        last_modified_func=get_newest if last_modified else None,
+    )
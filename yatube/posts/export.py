@@ -0,0 +1,83 @@
+"""Потоковая выгрузка постов с комментариями в NDJSON или CSV.
+
+Посты читаются через QuerySet.iterator(chunk_size=...), а комментарии
+добираются одним запросом на каждую пачку постов, так что память не
+зависит от объема выгрузки. Поля совпадают с форматом import_data:
+выгрузку можно загрузить обратно.
+"""
+import csv
+import json
+from collections import defaultdict
+
+from .loading import batched
+from .models import Comment, Post
+
+FORMATS = {
+    'ndjson': ('application/x-ndjson', 'jsonl'),
+    'csv': ('text/csv', 'csv'),
+}
+CSV_FIELDS = (
+    'id', 'author', 'group', 'text', 'pub_date', 'image', 'comments',
+)
+
+
+def posts_for(author=None, group=None):
+    posts = Post.objects.select_related('author', 'group').order_by('pk')
+    if author:
+        posts = posts.filter(author__username=author)
+    if group:
+        posts = posts.filter(group__slug=group)
+    return posts
+
+
+def records(posts, chunk_size=2000):
+    """Словари постов вместе с их комментариями, по одной пачке за раз."""
+    for batch in batched(posts.iterator(chunk_size=chunk_size), chunk_size):
+        comments = defaultdict(list)
+        rows = Comment.objects.filter(
+            post_id__in=[post.pk for post in batch]
+        ).order_by('post_id', 'created').values_list(
+            'post_id', 'author__username', 'text', 'created'
+        )
+        for post_id, author, text, created in rows:
+            comments[post_id].append({
+                'author': author,
+                'text': text,
+                'created': created.isoformat(),
+            })
+        for post in batch:
+            yield {
+                'id': post.pk,
+                'author': post.author.username,
+                'group': post.group.slug if post.group_id else None,
+                'text': post.text,
+                'pub_date': post.pub_date.isoformat(),
+                'image': post.image.name,
+                'comments': comments[post.pk],
+            }
+
+
+class Echo:
+    """Файлоподобный объект, который возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def ndjson_lines(records):
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+def csv_lines(records):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_FIELDS)
+    for record in records:
+        record['comments'] = json.dumps(record['comments'],
+                                        ensure_ascii=False)
+        yield writer.writerow([record[field] for field in CSV_FIELDS])
+
+
+def lines(export_format, posts, chunk_size=2000):
+    writer = ndjson_lines if export_format == 'ndjson' else csv_lines
+    return writer(records(posts, chunk_size))
@@ -0,0 +1,169 @@
+"""Генерация правдоподобных данных для нагрузочных замеров.
+
+Популярность распределена по закону Ципфа: немногие авторы пишут
+большую часть постов и собирают большую часть подписчиков, а
+комментируют в основном свежие посты. Строки вставляются через
+bulk_create пачками, поэтому сигналы не срабатывают: после генерации
+loading.refresh() пересчитывает счетчики, поисковый индекс и ленты
+подписок.
+
+Первичные ключи новых строк берутся как непрерывный диапазон после
+максимального ключа до вставки, так что генерировать данные стоит
+в базу, в которую параллельно никто не пишет.
+"""
+import itertools
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.utils import timezone
+
+from .loading import batched, explicit_dates, last_pk
+from .models import Comment, Follow, Group, Post, User
+
+SYLLABLES = (
+    'ка', 'ло', 'ми', 'ра', 'то', 'не', 'ве', 'ду', 'жи', 'по',
+    'сы', 'ше', 'бо', 'зу', 'ля', 'гре', 'ство', 'ник', 'ость', 'ение',
+)
+
+
+def vocabulary(rng, size):
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choices(SYLLABLES, k=rng.randint(2, 4))))
+    return sorted(words)
+
+
+def zipf_weights(size, exponent=1.0):
+    """Накопленные веса для rng.choices(cum_weights=...)."""
+    return list(itertools.accumulate(
+        1 / rank ** exponent for rank in range(1, size + 1)
+    ))
+
+
+def insert(model, objects, batch_size, progress=None):
+    """Вставляет объекты пачками, возвращает диапазон их ключей."""
+    first = last_pk(model) + 1
+    total = 0
+    if progress is not None:
+        progress(model, 0)
+    for batch in batched(objects, batch_size):
+        model.objects.bulk_create(batch, ignore_conflicts=True)
+        total += len(batch)
+        if progress is not None:
+            progress(model, total)
+    return range(first, last_pk(model) + 1)
+
+
+class Generator:
+    def __init__(self, seed=0, batch_size=1000, days=365, progress=None):
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        self.days = days
+        self.progress = progress
+        self.words = vocabulary(self.rng, 20_000)
+        self.word_weights = zipf_weights(len(self.words))
+        self.now = timezone.now()
+
+    def text(self, low, high):
+        return ' '.join(self.rng.choices(
+            self.words,
+            cum_weights=self.word_weights,
+            k=self.rng.randint(low, high),
+        )).capitalize()
+
+    def users(self, count, prefix='user'):
+        start = User.objects.count()
+        # Пароль у всех один и непригодный для входа: хэшировать
+        # миллионы паролей по отдельности слишком долго.
+        password = make_password(None)
+        return insert(User, (
+            User(
+                username=f'{prefix}{start + num}',
+                first_name=self.rng.choice(self.words).capitalize(),
+                password=password,
+            )
+            for num in range(count)
+        ), self.batch_size, self.progress)
+
+    def groups(self, count):
+        start = Group.objects.count()
+        return insert(Group, (
+            Group(
+                title=self.text(1, 3),
+                slug=f'group-{start + num}',
+                description=self.text(5, 20),
+            )
+            for num in range(count)
+        ), self.batch_size, self.progress)
+
+    def posts(self, count, user_ids, group_ids, group_share=0.6):
+        author_weights = zipf_weights(len(user_ids))
+        group_weights = zipf_weights(len(group_ids)) if group_ids else None
+        step = timedelta(days=self.days) / max(count, 1)
+        start = self.now - timedelta(days=self.days)
+
+        def rows():
+            for num in range(count):
+                group_id = None
+                if group_ids and self.rng.random() < group_share:
+                    group_id = self.rng.choices(
+                        group_ids, cum_weights=group_weights
+                    )[0]
+                post = Post(
+                    author_id=self.rng.choices(
+                        user_ids, cum_weights=author_weights
+                    )[0],
+                    group_id=group_id,
+                    text=self.text(5, 80),
+                    pub_date=start + step * num,
+                )
+                post.fill_excerpt()
+                yield post
+
+        with explicit_dates(Post._meta.get_field('pub_date')):
+            return insert(Post, rows(), self.batch_size, self.progress)
+
+    def follows(self, count, user_ids):
+        author_weights = zipf_weights(len(user_ids))
+
+        def rows():
+            for _ in range(count):
+                user_id = self.rng.choice(user_ids)
+                author_id = self.rng.choices(
+                    user_ids, cum_weights=author_weights
+                )[0]
+                if user_id != author_id:
+                    yield Follow(user_id=user_id, author_id=author_id)
+
+        return insert(Follow, rows(), self.batch_size, self.progress)
+
+    def comments(self, count, user_ids, post_ids):
+        # Свежие посты комментируют чаще: расстояние от последнего
+        # поста распределено экспоненциально.
+        mean_age = max(len(post_ids) / 10, 1)
+
+        def rows():
+            for _ in range(count):
+                age = min(int(self.rng.expovariate(1 / mean_age)),
+                          len(post_ids) - 1)
+                yield Comment(
+                    post_id=post_ids[-1 - age],
+                    author_id=self.rng.choice(user_ids),
+                    text=self.text(3, 30),
+                    created=self.now - timedelta(
+                        minutes=self.rng.expovariate(1 / 600)
+                    ),
+                )
+
+        with explicit_dates(Comment._meta.get_field('created')):
+            return insert(Comment, rows(), self.batch_size, self.progress)
+
+    def generate(self, users, groups, posts, follows, comments):
+        user_ids = self.users(users)
+        group_ids = self.groups(groups)
+        post_ids = self.posts(posts, user_ids, group_ids)
+        if user_ids:
+            self.follows(follows, user_ids)
+        if user_ids and post_ids:
+            self.comments(comments, user_ids, post_ids)
@@ -0,0 +1,158 @@
+"""Легкие строки постов для лент вместо экземпляров модели.
+
+Карточке поста нужны несколько колонок, а экземпляр Post с автором и
+группой — это три модели со словарями атрибутов, состоянием и FieldFile.
+FeedRows выбирает только нужные колонки через values_list, вместо
+текста — сохраненное начало (Post.excerpt), и каждая строка хранится
+кортежем в PostRow со __slots__. Число постов и страницы строк
+кэшируются под поколениями областей (posts.caching), так что лента
+перестраивается без базы, пока в ней ничего не поменялось. Запросы,
+закрепленные за основной базой, кэш строк минуют, как и кэш страниц:
+под новым поколением могли лечь строки с отстающей реплики.
+
+PostRow отвечает на те же обращения, что и пост в шаблонах:
+post.author.username, post.group.slug, post.image.name.
+"""
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+
+from core.db import pinned
+
+from .caching import fresh_reads, get_generation
+from .models import Post
+
+FEED_ROWS_KEY = 'posts:feed_rows:{}:{}:{}'
+ROW_FIELDS = (
+    'pk', 'excerpt', 'truncated', 'pub_date', 'image', 'author__username',
+    'author__first_name', 'author__last_name', 'group__slug',
+    'comment_count',
+)
+
+
+class RowAuthor(namedtuple('RowAuthor', 'username full_name')):
+    __slots__ = ()
+
+    def get_full_name(self):
+        return self.full_name
+
+
+RowGroup = namedtuple('RowGroup', 'slug')
+
+
+class RowImage(str):
+    """Путь картинки, который читается как FieldFile: .name и .url."""
+    __slots__ = ()
+
+    @property
+    def name(self):
+        return str(self)
+
+    @property
+    def url(self):
+        return default_storage.url(self)
+
+
+class PostRow:
+    __slots__ = (
+        'id', 'excerpt', 'truncated', 'pub_date', 'image_name',
+        'author_username', 'author_name', 'group_slug', 'comment_count',
+    )
+
+    def __init__(self, id, excerpt, truncated, pub_date, image_name,
+                 author_username, author_name, group_slug, comment_count):
+        self.id = id
+        self.excerpt = excerpt
+        self.truncated = truncated
+        self.pub_date = pub_date
+        self.image_name = image_name
+        self.author_username = author_username
+        self.author_name = author_name
+        self.group_slug = group_slug
+        self.comment_count = comment_count
+
+    def __repr__(self):
+        return f'<PostRow {self.id}>'
+
+    def __eq__(self, other):
+        # Как у моделей: строка равна посту, из которого получена.
+        if isinstance(other, (PostRow, Post)):
+            return self.pk == other.pk
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.pk)
+
+    @property
+    def pk(self):
+        return self.id
+
+    @property
+    def author(self):
+        return RowAuthor(self.author_username, self.author_name)
+
+    @property
+    def group(self):
+        return RowGroup(self.group_slug) if self.group_slug else None
+
+    @property
+    def image(self):
+        return RowImage(self.image_name or '')
+
+
+def pack(values):
+    """Кортеж для кэша из строки values_list(*ROW_FIELDS)."""
+    (pk, excerpt, truncated, pub_date, image, username, first_name,
+     last_name, group_slug, comment_count) = values
+    return (
+        pk, excerpt, truncated, pub_date, image, username,
+        f'{first_name} {last_name}'.strip(), group_slug, comment_count,
+    )
+
+
+class FeedRows:
+    """Посты ленты строками PostRow; годится как object_list Paginator.
+
+    name отличает ленту, scopes — области, от которых она зависит.
+    """
+
+    def __init__(self, queryset, name, scopes):
+        self.queryset = queryset
+        self.name = name
+        self.scopes = scopes
+        self._generations = None
+
+    def key(self, part):
+        if self._generations is None:
+            self._generations = '.'.join(
+                str(get_generation(scope)) for scope in self.scopes
+            )
+        return FEED_ROWS_KEY.format(self.name, self._generations, part)
+
+    def cached(self, part, compute):
+        if pinned():
+            return compute()
+        key = self.key(part)
+        with fresh_reads(self.scopes):
+            return cache.get_or_set(key, compute, settings.PAGE_CACHE_TIMEOUT)
+
+    def count(self):
+        return self.cached('count', self.queryset.count)
+
+    def __len__(self):
+        return self.count()
+
+    def fetch(self, start, stop):
+        rows = self.queryset.values_list(*ROW_FIELDS)[start:stop]
+        return [pack(values) for values in rows]
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop = index.start or 0, index.stop
+        packed = self.cached(
+            f'{start}:{stop}', lambda: self.fetch(start, stop)
+        )
+        return [PostRow(*values) for values in packed]
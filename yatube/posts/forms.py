@@ -1,8 +1,38 @@
 from django import forms
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.template.defaultfilters import filesizeformat
+
+from .images import normalize_image
 from .models import Post, Comment
 
 
 class PostForm(forms.ModelForm):
+    def __init__(self, *args, rejected_files=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rejected_files = rejected_files
+
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        limit = settings.POST_IMAGE_MAX_UPLOAD_SIZE
+        if 'image' in self.rejected_files or (
+            isinstance(image, UploadedFile) and image.size > limit
+        ):
+            raise forms.ValidationError(
+                f'Картинка больше {filesizeformat(limit)}.'
+            )
+        if isinstance(image, UploadedFile):
+            try:
+                return normalize_image(image)
+            except (OSError, SyntaxError):
+                # ImageField проверяет только заголовок: обрезанный файл
+                # проходит проверку и ломается при декодировании.
+                raise forms.ValidationError(
+                    forms.ImageField.default_error_messages['invalid_image'],
+                    code='invalid_image',
+                )
+        return image
+
     class Meta:
         model = Post
         fields = ('text', 'group', 'image',)
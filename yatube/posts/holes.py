@@ -0,0 +1,26 @@
+"""Пользовательские фрагменты страниц постов (core.holes)."""
+from core.holes import register
+
+from .forms import CommentForm
+from .models import Follow
+
+
+@register('switcher', 'posts/includes/switcher.html')
+def switcher_context(request, active):
+    return {'active': active}
+
+
+@register('comment_form', 'posts/includes/comment_form.html')
+def comment_form_context(request, post_id):
+    return {'post_id': post_id, 'form': CommentForm()}
+
+
+@register('follow_button', 'posts/includes/follow_button.html')
+def follow_button_context(request, username):
+    following = (
+        request.user.is_authenticated
+        and Follow.objects.filter(
+            user=request.user, author__username=username
+        ).exists()
+    )
+    return {'author_username': username, 'following': following}
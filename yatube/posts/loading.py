@@ -0,0 +1,378 @@
+"""Потоковая загрузка пользователей, групп, постов, комментариев и подписок.
+
+Файлы JSONL и CSV читаются построчно и вставляются через bulk_create
+пачками, каждая в своей транзакции, так что память не зависит от размера
+файла. Ссылки задаются естественными ключами: автор и подписчик —
+username, группа — slug, пост комментария — id. Они разрешаются одним
+запросом на пачку; строки без обязательных полей, с неверными значениями
+или с несуществующими ссылками пропускаются. Пароли не загружаются:
+пользователи получают непригодный пароль и задают свой через сброс.
+
+bulk_create не отправляет сигналы, поэтому после загрузки refresh()
+пересчитывает счетчики, поисковый индекс и ленты подписок и сбрасывает
+кэш страниц — только для загруженных строк.
+"""
+import csv
+import itertools
+import json
+import time
+from contextlib import contextmanager
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import search, timeline
+from .caching import bump_generation
+from .models import (
+    Comment, Follow, Group, Post, User, UserStats, count_subquery,
+)
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+@contextmanager
+def explicit_dates(*fields):
+    """Отключает auto_now_add, чтобы даты можно было задать самим."""
+    saved = [(field, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, value in saved:
+            field.auto_now_add = value
+
+
+class Progress:
+    """Печатает число вставленных строк и скорость по каждой модели."""
+
+    def __init__(self, write, every=50_000):
+        self.write = write
+        self.every = every
+        self.started = {}
+        self.updated = {}
+        self.totals = {}
+
+    def __call__(self, model, total):
+        name = model._meta.model_name
+        now = time.perf_counter()
+        self.started.setdefault(name, now)
+        self.updated[name] = now
+        previous = self.totals.get(name, 0)
+        self.totals[name] = total
+        if total // self.every > previous // self.every:
+            self.write(f'{name}: {total} строк, {self.rate(name):.0f} строк/с')
+
+    def rate(self, name):
+        elapsed = self.updated[name] - self.started[name]
+        return self.totals[name] / elapsed if elapsed else 0
+
+    def summary(self):
+        return [
+            f'{name}: {total} строк, {self.rate(name):.0f} строк/с'
+            for name, total in self.totals.items()
+        ]
+
+
+def read_rows(file, format):
+    """Строки файла словарями; битая строка JSON дает None, и build_*
+    пропускают ее вместе с остальными неверными строками."""
+    if format == 'csv':
+        yield from csv.DictReader(file)
+        return
+    for line in file:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+
+
+def lookup(model, field, values):
+    values = set(values) - {None, ''}
+    if not values:
+        return {}
+    return dict(
+        model.objects.filter(**{f'{field}__in': values}).values_list(
+            field, 'pk'
+        )
+    )
+
+
+def optional_date(value):
+    if not value:
+        return None
+    date = parse_datetime(value)
+    if date is None:
+        raise ValueError(f'Неверная дата: {value}')
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date)
+    return date
+
+
+def required(row, field):
+    """Непустая строка из поля row или ValueError."""
+    value = row[field]
+    if not isinstance(value, str) or not value:
+        raise ValueError(f'Нет значения {field}')
+    return value
+
+
+def parsed(rows, parse_row):
+    """Разобранные parse_row строки; неполные и неверные отбрасываются,
+    а load() считает их пропущенными."""
+    result = []
+    for row in rows:
+        try:
+            result.append(parse_row(row))
+        except (AttributeError, KeyError, TypeError, ValueError):
+            continue
+    return result
+
+
+def build_users(rows):
+    # Один непригодный пароль на всех: хэшировать его для каждой строки
+    # незачем.
+    password = make_password(None)
+    return parsed(rows, lambda row: User(
+        username=required(row, 'username'),
+        first_name=row.get('first_name') or '',
+        last_name=row.get('last_name') or '',
+        email=row.get('email') or '',
+        password=password,
+    ))
+
+
+def build_groups(rows):
+    return parsed(rows, lambda row: Group(
+        title=required(row, 'title'),
+        slug=required(row, 'slug'),
+        description=row.get('description') or '',
+    ))
+
+
+def build_posts(rows):
+    rows = parsed(rows, lambda row: {
+        'author': required(row, 'author'),
+        'group': row.get('group') or None,
+        'text': required(row, 'text'),
+        'image': row.get('image') or '',
+        'pub_date': optional_date(row.get('pub_date')),
+    })
+    authors = lookup(User, 'username', (row['author'] for row in rows))
+    groups = lookup(Group, 'slug', (row['group'] for row in rows))
+    posts = [
+        Post(
+            author_id=authors[row['author']],
+            group_id=groups.get(row['group']),
+            text=row['text'],
+            image=row['image'],
+            pub_date=row['pub_date'],
+        )
+        for row in rows
+        if row['author'] in authors
+    ]
+    # bulk_create не вызывает save(), начало текста считаем сами.
+    for post in posts:
+        post.fill_excerpt()
+    return posts
+
+
+def build_comments(rows):
+    rows = parsed(rows, lambda row: {
+        'post': int(row['post']),
+        'author': required(row, 'author'),
+        'text': required(row, 'text'),
+        'created': optional_date(row.get('created')),
+    })
+    authors = lookup(User, 'username', (row['author'] for row in rows))
+    posts = lookup(Post, 'pk', (row['post'] for row in rows))
+    return [
+        Comment(
+            post_id=row['post'],
+            author_id=authors[row['author']],
+            text=row['text'],
+            created=row['created'],
+        )
+        for row in rows
+        if row['author'] in authors and row['post'] in posts
+    ]
+
+
+def build_follows(rows):
+    rows = parsed(rows, lambda row: (
+        required(row, 'user'), required(row, 'author'),
+    ))
+    users = lookup(User, 'username', itertools.chain.from_iterable(rows))
+    return [
+        Follow(user_id=users[user], author_id=users[author])
+        for user, author in rows
+        if user in users and author in users and user != author
+    ]
+
+
+BUILDERS = {
+    'user': (User, build_users),
+    'group': (Group, build_groups),
+    'post': (Post, build_posts),
+    'comment': (Comment, build_comments),
+    'follow': (Follow, build_follows),
+}
+DATE_FIELDS = {
+    Post: ('pub_date',),
+    Comment: ('created',),
+}
+
+
+def load(model_name, rows, batch_size=1000, progress=None):
+    """Вставляет строки пачками, возвращает (отправлено, пропущено).
+
+    Дубликаты уникальных полей (username, slug, подписка) база молча
+    отбрасывает, они считаются отправленными.
+    """
+    model, build = BUILDERS[model_name]
+    date_fields = [
+        model._meta.get_field(name) for name in DATE_FIELDS.get(model, ())
+    ]
+    loaded = skipped = 0
+    if progress is not None:
+        progress(model, 0)
+    for batch in batched(rows, batch_size):
+        objects = build(batch)
+        skipped += len(batch) - len(objects)
+        for field in date_fields:
+            # Даты, которых нет в файле, ставятся как при auto_now_add.
+            for obj in objects:
+                if getattr(obj, field.attname) is None:
+                    field.pre_save(obj, add=True)
+        with transaction.atomic(), explicit_dates(*date_fields):
+            model.objects.bulk_create(objects, ignore_conflicts=True)
+        loaded += len(objects)
+        if progress is not None:
+            progress(model, loaded)
+    return loaded, skipped
+
+
+def last_pk(model):
+    return model.objects.aggregate(last=Max('pk'))['last'] or 0
+
+
+def recount_users(user_ids, batch_size=500):
+    for batch in batched(user_ids.iterator(), batch_size):
+        UserStats.objects.recount(user_ids=batch)
+
+
+def page_scopes(user_ids=None, group_ids=None, post_ids=None):
+    """Области кэша страниц пользователей, групп и постов из подзапросов."""
+    scopes = []
+    if user_ids is not None:
+        scopes += (
+            f'profile:{username}' for username in User.objects.filter(
+                pk__in=user_ids
+            ).values_list('username', flat=True).iterator()
+        )
+    if group_ids is not None:
+        scopes += (
+            f'group:{slug}' for slug in Group.objects.filter(
+                pk__in=group_ids
+            ).values_list('slug', flat=True).iterator()
+        )
+    if post_ids is not None:
+        scopes += (f'post:{pk}' for pk in post_ids.iterator())
+    return scopes
+
+
+def distinct(rows, field):
+    return rows.order_by().values_list(field, flat=True).distinct()
+
+
+def refresh_users(users):
+    recount_users(users.values_list('pk', flat=True))
+
+
+def refresh_posts(posts):
+    authors = distinct(posts, 'author')
+    groups = distinct(posts.exclude(group=None), 'group')
+    recount_users(authors)
+    Group.objects.filter(pk__in=groups).update(
+        posts_count=count_subquery(Post, 'group')
+    )
+    search.get_backend().add(posts)
+    if timeline.enabled():
+        for post in posts.only('author', 'pub_date').iterator():
+            timeline.fan_out(post)
+    bump_generation('index', *page_scopes(authors, groups))
+
+
+def refresh_comments(comments):
+    authors = distinct(comments, 'author')
+    post_ids = distinct(comments, 'post')
+    posts = Post.objects.filter(pk__in=post_ids)
+    recount_users(authors)
+    # Карточки в лентах показывают число комментариев.
+    bump_generation(
+        'index',
+        *page_scopes(authors),
+        *page_scopes(
+            distinct(posts, 'author'),
+            distinct(posts.exclude(group=None), 'group'),
+            post_ids,
+        ),
+    )
+
+
+def refresh_follows(follows):
+    users = distinct(follows, 'user')
+    authors = distinct(follows, 'author')
+    recount_users(users)
+    recount_users(authors)
+    if timeline.enabled():
+        rows = follows.values_list('user_id', 'author_id')
+        for user_id, author_id in rows.iterator():
+            timeline.backfill(user_id, author_id)
+    bump_generation(*page_scopes(users), *page_scopes(authors))
+
+
+# Новые группы пусты: их счетчики и страницы пересчитывать не нужно.
+REFRESHERS = {
+    'user': refresh_users,
+    'post': refresh_posts,
+    'comment': refresh_comments,
+    'follow': refresh_follows,
+}
+
+
+def refresh(model_name=None, after=None):
+    """Пересчитывает то, что обычно поддерживают сигналы.
+
+    Без аргументов — все целиком, включая кэш всех страниц. С model_name
+    и after — только то, что затронули строки модели с ключами больше
+    after (last_pk() до загрузки), и сбрасывает кэш страниц с ними один
+    раз на всю загрузку.
+    """
+    if model_name is None:
+        UserStats.objects.recount()
+        Group.objects.update(posts_count=count_subquery(Post, 'group'))
+        search.get_backend().rebuild()
+        if timeline.enabled():
+            timeline.rebuild()
+        bump_generation('index', *page_scopes(
+            User.objects.values('pk'),
+            Group.objects.values('pk'),
+            Post.objects.values_list('pk', flat=True),
+        ))
+        return
+    model, _ = BUILDERS[model_name]
+    refresher = REFRESHERS.get(model_name)
+    if refresher is not None:
+        refresher(model.objects.filter(pk__gt=after))
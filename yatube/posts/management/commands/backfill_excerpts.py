@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from posts.caching import bump_generation
+from posts.models import Group, Post, User
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает сохраненные начала текста постов: для строк, '
+        'вставленных в обход save(), и после смены FEED_TEXT_LENGTH.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько постов читать и обновлять за один запрос.',
+        )
+
+    def handle(self, *args, **options):
+        fixed = Post.objects.backfill_excerpts(
+            batch_size=options['batch_size']
+        )
+        if fixed:
+            # Устарели только ленты: страница поста показывает полный
+            # текст, так что поколения постов не трогаем, сколько бы их
+            # ни исправили.
+            _, author_ids, group_ids = zip(*fixed)
+            usernames = User.objects.filter(
+                pk__in=set(author_ids)
+            ).values_list('username', flat=True)
+            slugs = Group.objects.filter(
+                pk__in=set(group_ids) - {None}
+            ).values_list('slug', flat=True)
+            bump_generation(
+                'index',
+                *(f'profile:{username}' for username in usernames),
+                *(f'group:{slug}' for slug in slugs),
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено начал текста: {len(fixed)}.'
+        ))
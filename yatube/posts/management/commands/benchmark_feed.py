@@ -0,0 +1,49 @@
+import random
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts import benchmarks
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает страницы ленты из экземпляров Post и из строк '
+        'PostRow: время выборки и сборки, память и размер в кэше.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=200)
+        parser.add_argument('--per-page', type=int,
+                            default=settings.POSTS_PER_PAGE)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        per_page = options['per_page']
+        total = Post.objects.count()
+        if total < per_page:
+            self.stderr.write('Мало постов: запустите generate_data.')
+            return
+        rng = random.Random(options['seed'])
+        starts = [
+            rng.randrange(0, total - per_page + 1)
+            for _ in range(options['pages'])
+        ]
+        results = {
+            name: benchmarks.measure_feed_pages(load, starts, per_page)
+            for name, load in benchmarks.feed_page_loaders().items()
+        }
+        for name, summary in results.items():
+            self.stdout.write(
+                f'{name}: p50 {summary["p50_ms"]} мс, '
+                f'p95 {summary["p95_ms"]} мс, '
+                f'память {summary["kib_per_page"]} КиБ, '
+                f'в кэше {summary["cached_kib_per_page"]} КиБ на страницу'
+            )
+        models, rows = results['models'], results['rows']
+        self.stdout.write(
+            f'строки быстрее в {models["p50_ms"] / rows["p50_ms"]:.1f} раза, '
+            f'легче в {models["kib_per_page"] / rows["kib_per_page"]:.1f} '
+            'раза'
+        )
@@ -0,0 +1,87 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import benchmarks, fake_data, search
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет поиск на синтетических постах. Посты создаются в '
+        'транзакции, которая в конце откатывается.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=1_000_000)
+        parser.add_argument('--vocabulary', type=int, default=50_000)
+        parser.add_argument('--words', type=int, default=30,
+                            help='Слов в одном посте.')
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def fill(self, rng, words, options):
+        author = get_user_model().objects.create(username='search-benchmark')
+        # Частоты слов по закону Ципфа, как в живых текстах.
+        weights = [1 / rank for rank in range(1, len(words) + 1)]
+        batch_size = options['batch_size']
+        for start in range(0, options['posts'], batch_size):
+            count = min(batch_size, options['posts'] - start)
+            Post.objects.bulk_create(
+                Post(
+                    author=author,
+                    text=' '.join(rng.choices(
+                        words, weights, k=options['words']
+                    )),
+                )
+                for _ in range(count)
+            )
+        return weights
+
+    def measure(self, backend, queries, per_page):
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            results = search.SearchResults(query, backend)
+            results.count()
+            results[:per_page]
+            timings.append(time.perf_counter() - started)
+        return benchmarks.summarize(timings)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        words = fake_data.vocabulary(rng, options['vocabulary'])
+        backends = [search.InvertedIndexBackend()]
+        if search.fts_available():
+            backends.insert(0, search.FtsBackend())
+        with transaction.atomic():
+            started = time.perf_counter()
+            weights = self.fill(rng, words, options)
+            self.stdout.write(
+                f'Постов создано: {options["posts"]} '
+                f'за {time.perf_counter() - started:.1f} с'
+            )
+            # Запросы из одного и двух слов средней частоты.
+            queries = [
+                ' '.join(rng.choices(words[10:1000], weights[10:1000],
+                                     k=rng.randint(1, 2)))
+                for _ in range(options['queries'])
+            ]
+            for backend in backends:
+                name = type(backend).__name__
+                started = time.perf_counter()
+                backend.rebuild()
+                self.stdout.write(
+                    f'{name}: индекс построен '
+                    f'за {time.perf_counter() - started:.1f} с'
+                )
+                summary = self.measure(backend, queries, 10)
+                self.stdout.write(self.style.SUCCESS(
+                    f'{name}: p50 {summary["p50_ms"]} мс, '
+                    f'p95 {summary["p95_ms"]} мс'
+                ))
+            transaction.set_rollback(True)
@@ -0,0 +1,109 @@
+import json
+import platform
+import random
+import subprocess
+
+import django
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from posts import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет p50/p95 задержки и число запросов основных страниц и '
+        'пишет отчет в JSON. База берется из настроек (SQLite или '
+        'локальный Postgres); --generate сначала наполняет ее данными. '
+        'Сами замеры идут в транзакции, которая откатывается.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--generate', action='store_true',
+                            help='Сгенерировать данные перед замером.')
+        parser.add_argument('--users', type=int, default=5_000)
+        parser.add_argument('--groups', type=int, default=100)
+        parser.add_argument('--posts', type=int, default=300_000)
+        parser.add_argument('--follows', type=int, default=50_000)
+        parser.add_argument('--comments', type=int, default=200_000)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--requests', type=int, default=30,
+                            help='Запросов к каждому view в каждом режиме.')
+        parser.add_argument('--views', nargs='*',
+                            help='Замерять только эти view.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Файл для отчета в JSON.')
+        parser.add_argument('--compare',
+                            help='Прошлый отчет для сравнения.')
+
+    def generate(self, options):
+        call_command(
+            'generate_data',
+            **{
+                name: options[name] for name in (
+                    'users', 'groups', 'posts', 'follows', 'comments',
+                    'batch_size', 'seed',
+                )
+            },
+            stdout=self.stderr,
+        )
+
+    def revision(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def compare(self, report, path):
+        with open(path, encoding='utf-8') as file:
+            previous = json.load(file)['views']
+        for view, modes in report['views'].items():
+            for mode, current in modes.items():
+                old = previous.get(view, {}).get(mode)
+                if old is None:
+                    continue
+                changes = ', '.join(
+                    f'{key} {old[key]} -> {current[key]}'
+                    f' ({(current[key] - old[key]) / old[key]:+.0%})'
+                    if old[key] else f'{key} {old[key]} -> {current[key]}'
+                    for key in ('p50_ms', 'p95_ms', 'queries_max')
+                )
+                self.stdout.write(f'{view} [{mode}]: {changes}')
+
+    def handle(self, *args, **options):
+        if options['generate']:
+            self.generate(options)
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            benchmark = benchmarks.ViewBenchmark(rng, options['requests'])
+            views = benchmark.run(options['views'])
+            transaction.set_rollback(True)
+        report = {
+            'created': timezone.now().isoformat(),
+            'revision': self.revision(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'dataset': benchmarks.dataset_size(),
+            'requests': options['requests'],
+            'seed': options['seed'],
+            'views': views,
+        }
+        for view, modes in views.items():
+            for mode, summary in modes.items():
+                self.stdout.write(
+                    f'{view:>13} {mode:>4}: p50 {summary["p50_ms"]} мс, '
+                    f'p95 {summary["p95_ms"]} мс, '
+                    f'запросов до {summary["queries_max"]}'
+                )
+        if options['compare']:
+            self.compare(report, options['compare'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2,
+                          sort_keys=True)
@@ -0,0 +1,110 @@
+import random
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection
+from django.test import Client
+from django.urls import reverse
+
+from posts import benchmarks
+from posts.models import Post, User
+
+USERNAME = 'bench-writer-{}'
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет конкурентную запись: несколько потоков одновременно '
+        'создают посты и комментарии через post_create и add_comment. '
+        'Сравнивайте запуски с разными настройками базы, например '
+        'SQLITE_JOURNAL_MODE=DELETE и WAL. Созданные данные удаляются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Запросов на одного писателя.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def writer(self, number, requests, seed):
+        rng = random.Random(seed + number)
+        client = Client()
+        client.force_login(User.objects.get(username=USERNAME.format(number)))
+        timings = defaultdict(list)
+        errors = Counter()
+        post_ids = []
+        try:
+            for num in range(requests):
+                if post_ids and rng.random() < 0.7:
+                    action = 'add_comment'
+                    url = reverse('posts:add_comment', kwargs={
+                        'post_id': rng.choice(post_ids)
+                    })
+                    data = {'text': f'Комментарий {num}'}
+                else:
+                    action = 'post_create'
+                    url = reverse('posts:post_create')
+                    data = {'text': f'Пост писателя {number}, номер {num}'}
+                started = time.perf_counter()
+                try:
+                    response = client.post(url, data)
+                except DatabaseError as error:
+                    errors[str(error)] += 1
+                    continue
+                timings[action].append(time.perf_counter() - started)
+                if response.status_code != 302:
+                    errors[f'{action}: {response.status_code}'] += 1
+                elif action == 'post_create':
+                    post_ids.append(Post.objects.filter(
+                        author__username=USERNAME.format(number)
+                    ).values_list('pk', flat=True).latest('pk'))
+        finally:
+            connection.close()
+        return timings, errors
+
+    def handle(self, *args, **options):
+        writers = options['writers']
+        for number in range(writers):
+            User.objects.get_or_create(username=USERNAME.format(number))
+        with connection.cursor() as cursor:
+            settings = {}
+            if connection.vendor == 'sqlite':
+                for pragma in ('journal_mode', 'synchronous', 'busy_timeout'):
+                    cursor.execute(f'PRAGMA {pragma}')
+                    settings[pragma] = cursor.fetchone()[0]
+        self.stdout.write(f'База: {connection.vendor} {settings}')
+        timings = defaultdict(list)
+        errors = Counter()
+        started = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=writers) as pool:
+                results = pool.map(
+                    lambda number: self.writer(
+                        number, options['requests'], options['seed']
+                    ),
+                    range(writers),
+                )
+                for writer_timings, writer_errors in results:
+                    for action, values in writer_timings.items():
+                        timings[action].extend(values)
+                    errors.update(writer_errors)
+        finally:
+            User.objects.filter(
+                username__in=[USERNAME.format(num) for num in range(writers)]
+            ).delete()
+        elapsed = time.perf_counter() - started
+        done = sum(len(values) for values in timings.values())
+        for action, values in sorted(timings.items()):
+            summary = benchmarks.summarize(values)
+            self.stdout.write(
+                f'{action}: {len(values)} запросов, '
+                f'p50 {summary["p50_ms"]} мс, p95 {summary["p95_ms"]} мс'
+            )
+        for error, count in errors.most_common():
+            self.stdout.write(self.style.ERROR(f'{count} × {error}'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Пропускная способность: {done / elapsed:.0f} запросов/с '
+            f'({writers} писателей).'
+        ))
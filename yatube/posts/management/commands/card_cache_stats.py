@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from posts.templatetags.post_cards import card_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Показывает попадания и промахи кэша карточек постов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'views',
+            nargs='*',
+            default=['posts:index', 'posts:group_posts', 'posts:profile',
+                     'posts:follow_index'],
+            help='Имена view, например posts:index.',
+        )
+
+    def handle(self, *args, **options):
+        for view_name in options['views']:
+            stats = card_cache_stats(view_name)
+            total = stats['hits'] + stats['misses']
+            ratio = stats['hits'] / total if total else 0
+            self.stdout.write(
+                f'{view_name}: попаданий {stats["hits"]}, '
+                f'промахов {stats["misses"]}, доля попаданий {ratio:.0%}'
+            )
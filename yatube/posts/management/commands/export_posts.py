@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from posts import export
+
+
+class Command(BaseCommand):
+    help = 'Выгружает посты с комментариями в NDJSON или CSV потоком.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format', choices=sorted(export.FORMATS), default='ndjson'
+        )
+        parser.add_argument('--output',
+                            help='Файл выгрузки, по умолчанию stdout.')
+        parser.add_argument('--author', help='Только посты автора.')
+        parser.add_argument('--group', help='Только посты группы (slug).')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        posts = export.posts_for(
+            author=options['author'], group=options['group']
+        )
+        lines = export.lines(options['format'], posts, options['chunk_size'])
+        if not options['output']:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+        count = 0
+        with open(options['output'], 'w', encoding='utf-8',
+                  newline='') as file:
+            for line in lines:
+                file.write(line)
+                count += 1
+        self.stderr.write(f'Строк выгружено: {count}.')
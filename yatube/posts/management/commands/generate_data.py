@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import fake_data, loading
+
+
+class Command(BaseCommand):
+    help = (
+        'Генерирует правдоподобных пользователей, группы, посты, '
+        'комментарии и подписки пачками через bulk_create.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10_000)
+        parser.add_argument('--groups', type=int, default=100)
+        parser.add_argument('--posts', type=int, default=1_000_000)
+        parser.add_argument('--follows', type=int, default=100_000)
+        parser.add_argument('--comments', type=int, default=1_000_000)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--no-refresh',
+            action='store_true',
+            help='Не пересчитывать счетчики, поиск и ленты после вставки.',
+        )
+
+    def handle(self, *args, **options):
+        progress = loading.Progress(self.stdout.write)
+        generator = fake_data.Generator(
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            progress=progress,
+        )
+        started = time.perf_counter()
+        generator.generate(
+            users=options['users'],
+            groups=options['groups'],
+            posts=options['posts'],
+            follows=options['follows'],
+            comments=options['comments'],
+        )
+        for line in progress.summary():
+            self.stdout.write(line)
+        if not options['no_refresh']:
+            refresh_started = time.perf_counter()
+            loading.refresh()
+            self.stdout.write(
+                f'Счетчики, поиск и ленты пересчитаны за '
+                f'{time.perf_counter() - refresh_started:.1f} с'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные сгенерированы за {time.perf_counter() - started:.1f} с.'
+        ))
@@ -0,0 +1,72 @@
+import os
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import loading
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает строки одной модели из файлов JSONL или CSV ("-" — '
+        'стандартный ввод) пачками через bulk_create, не держа файл '
+        'в памяти. Поля: user — username, first_name, last_name, email; '
+        'group — title, slug, description; post — author, group, text, '
+        'pub_date, image; comment — post, author, text, created; '
+        'follow — user, author.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+')
+        parser.add_argument(
+            '--model', required=True, choices=sorted(loading.BUILDERS)
+        )
+        parser.add_argument(
+            '--format',
+            choices=('jsonl', 'csv'),
+            help='По умолчанию определяется по расширению файла.',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--no-refresh',
+            action='store_true',
+            help=(
+                'Не пересчитывать счетчики, поиск и ленты и не сбрасывать '
+                'кэш страниц после загрузки.'
+            ),
+        )
+
+    def read(self, path, format):
+        if format is None:
+            format = 'csv' if path.lower().endswith('.csv') else 'jsonl'
+        if path == '-':
+            yield from loading.read_rows(sys.stdin, format)
+            return
+        if not os.path.exists(path):
+            raise CommandError(f'Файл {path} не найден.')
+        with open(path, encoding='utf-8', newline='') as file:
+            yield from loading.read_rows(file, format)
+
+    def handle(self, *args, **options):
+        progress = loading.Progress(self.stdout.write)
+        started = time.perf_counter()
+        model, _ = loading.BUILDERS[options['model']]
+        after = loading.last_pk(model)
+        loaded = skipped = 0
+        for path in options['paths']:
+            file_loaded, file_skipped = loading.load(
+                options['model'],
+                self.read(path, options['format']),
+                batch_size=options['batch_size'],
+                progress=progress,
+            )
+            loaded += file_loaded
+            skipped += file_skipped
+        if not options['no_refresh']:
+            loading.refresh(options['model'], after)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено строк: {loaded}, пропущено: {skipped}, '
+            f'{loaded / elapsed if elapsed else 0:.0f} строк/с.'
+        ))
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from posts.caching import bump_generation, post_scopes
+from posts.images import normalize_image
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Перекодирует загруженные ранее картинки постов и показывает, '
+        'сколько байт занимали и раздавались оригиналы до и после.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--apply',
+            action='store_true',
+            help='Сохранить перекодированные картинки вместо оригиналов.',
+        )
+
+    def handle(self, *args, **options):
+        before = after = images = 0
+        scopes = set()
+        posts = Post.objects.exclude(image='').only('image', 'author', 'group')
+        for post in posts.iterator():
+            storage = post.image.storage
+            old_name = post.image.name
+            if not storage.exists(old_name):
+                continue
+            try:
+                with storage.open(old_name) as original:
+                    normalized = normalize_image(original)
+                    original_size = original.size
+            except (OSError, SyntaxError):
+                self.stderr.write(f'Не удалось прочитать {old_name}.')
+                continue
+            images += 1
+            before += original_size
+            # Уже нормализованные картинки не пережимаем повторно.
+            if normalized.size >= original_size:
+                after += original_size
+                continue
+            after += normalized.size
+            if options['apply']:
+                post.image.save(normalized.name, normalized, save=False)
+                Post.objects.filter(pk=post.pk).update(image=post.image.name)
+                scopes.update(post_scopes(post))
+                if post.image.name != old_name:
+                    storage.delete(old_name)
+        # update() не шлет сигналов, а закэшированные страницы ссылаются
+        # на удаленные оригиналы.
+        bump_generation(*scopes)
+        saved = 1 - after / before if before else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Картинок: {images}; было {filesizeformat(before)}, '
+            f'стало {filesizeformat(after)} (экономия {saved:.0%}).'
+        ))
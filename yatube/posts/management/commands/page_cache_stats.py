@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from posts.caching import page_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Показывает, как часто страницы отдавались из кэша устаревшими.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'prefixes',
+            nargs='*',
+            default=['index_page', 'group_page', 'profile_page', 'post_page'],
+            help='Префиксы ключей страниц, например index_page.',
+        )
+
+    def handle(self, *args, **options):
+        for prefix in options['prefixes']:
+            stats = page_cache_stats(prefix)
+            total = sum(stats.values())
+            ratio = stats['stale'] / total if total else 0
+            self.stdout.write(
+                f'{prefix}: свежих {stats["hits"]}, '
+                f'перестроено {stats["misses"]}, '
+                f'устаревших {stats["stale"]}, '
+                f'дождались перестройки {stats["waits"]}, '
+                f'не допущено {stats["rejected"]}, '
+                f'вытеснено {stats["evicted"]}, '
+                f'доля устаревших {ratio:.0%}'
+            )
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+from posts.caching import bump_generation
+from posts.loading import batched, page_scopes
+from posts.models import Group, Post, UserStats, count_subquery
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает денормализованные счетчики пользователей и групп.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько строк обновлять за один запрос.',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        with transaction.atomic():
+            users_fixed = UserStats.objects.recount(batch_size=batch_size)
+            drifted = list(
+                Group.objects.annotate(
+                    total=count_subquery(Post, 'group')
+                ).exclude(posts_count=F('total')).only('pk')
+            )
+            for group in drifted:
+                group.posts_count = group.total
+            Group.objects.bulk_update(
+                drifted, ['posts_count'], batch_size=batch_size
+            )
+        # Счетчики видны на страницах профилей (и постов автора) и групп.
+        for user_ids in batched(users_fixed, batch_size):
+            bump_generation(*page_scopes(user_ids))
+        for groups in batched(drifted, batch_size):
+            bump_generation(*page_scopes(
+                group_ids=[group.pk for group in groups]
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено счетчиков: пользователей {len(users_fixed)}, '
+            f'групп {len(drifted)}.'
+        ))
@@ -0,0 +1,45 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Заново генерирует миниатюры всех картинок постов параллельно.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Число параллельных потоков.',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Удалить существующие миниатюры перед генерацией.',
+        )
+
+    def regenerate(self, name, force):
+        if force:
+            default.kvstore.delete_thumbnails(ImageFile(name))
+        return thumbnails.generate_safely(name)
+
+    def handle(self, *args, **options):
+        names = Post.objects.exclude(image='').order_by().values_list(
+            'image', flat=True
+        ).distinct()
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            results = list(pool.map(
+                lambda name: self.regenerate(name, options['force']),
+                names.iterator(),
+            ))
+        failed = results.count(False)
+        self.stdout.write(self.style.SUCCESS(
+            f'Миниатюр сгенерировано: {len(results) - failed}, '
+            f'ошибок: {failed}.'
+        ))
@@ -0,0 +1,69 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:44
+
+import re
+from collections import Counter
+
+from django.db import OperationalError, migrations, models, transaction
+import django.db.models.deletion
+
+FTS_TABLE = 'posts_search'
+
+
+def tokenize(text):
+    return [word[:64] for word in re.findall(r'\w+', text.lower())]
+
+
+def create_index(apps, schema_editor):
+    """Создает таблицу FTS5 на SQLite, иначе заполняет SearchTerm."""
+    Post = apps.get_model('posts', 'Post')
+    SearchTerm = apps.get_model('posts', 'SearchTerm')
+    if schema_editor.connection.vendor == 'sqlite':
+        try:
+            with transaction.atomic(using=schema_editor.connection.alias):
+                schema_editor.execute(
+                    f'CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5('
+                    f"text, tokenize = 'unicode61 remove_diacritics 0')"
+                )
+        except OperationalError:
+            pass
+        else:
+            schema_editor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, text) '
+                f'SELECT id, text FROM {Post._meta.db_table}'
+            )
+            return
+    SearchTerm.objects.bulk_create(
+        (
+            SearchTerm(term=term, post_id=post_id, frequency=frequency)
+            for post_id, text in Post.objects.values_list('pk', 'text')
+            for term, frequency in Counter(tokenize(text)).items()
+        )
+    )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0004_timeline'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('frequency', models.IntegerField(default=1)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='posts.Post')),
+            ],
+            options={
+                'unique_together': {('term', 'post')},
+            },
+        ),
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:28
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_excerpts(apps, schema_editor):
+    """Начала текста для уже сохраненных постов, как в Post.save()."""
+    Post = apps.get_model('posts', 'Post')
+    length = settings.FEED_TEXT_LENGTH
+    batch = []
+    posts = Post.objects.order_by('pk').only('pk', 'text')
+    for post in posts.iterator(chunk_size=1000):
+        if len(post.text) > length:
+            post.excerpt = post.text[:length - 1].rstrip() + '…'
+            post.truncated = True
+        else:
+            post.excerpt = post.text
+        batch.append(post)
+        if len(batch) >= 1000:
+            Post.objects.bulk_update(batch, ['excerpt', 'truncated'])
+            batch = []
+    Post.objects.bulk_update(batch, ['excerpt', 'truncated'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0005_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='excerpt',
+            field=models.TextField(blank=True, editable=False, verbose_name='Начало текста'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='truncated',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Текст обрезан'),
+        ),
+        migrations.RunPython(fill_excerpts, migrations.RunPython.noop),
+    ]
@@ -1,23 +1,129 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
+# Поля, которые нужны карточке поста в ленте (posts/includes/post_view.html).
+# Полный текст карточке не нужен: она показывает сохраненное начало.
+FEED_FIELDS = (
+    'excerpt',
+    'truncated',
+    'pub_date',
+    'image',
+    'author',
+    'author__username',
+    'author__first_name',
+    'author__last_name',
+    'group',
+    'group__slug',
+)
+FEED_ANNOTATIONS = ('comment_count',)
+
+
+def count_subquery(model, field):
+    """Коррелированный подзапрос с числом строк model, где field = pk."""
+    rows = model.objects.filter(
+        **{field: OuterRef('pk')}
+    ).order_by().values(field).annotate(
+        count=Count('pk')
+    ).values('count')
+    return Coalesce(Subquery(rows, output_field=IntegerField()), 0)
+
+
+def make_excerpt(text):
+    """Начало текста для лент (FEED_TEXT_LENGTH символов) и признак,
+    что текст обрезан."""
+    length = settings.FEED_TEXT_LENGTH
+    if len(text) <= length:
+        return text, False
+    return text[:length - 1].rstrip() + '…', True
+
 
 class Group(models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(unique=True)
     description = models.TextField()
+    posts_count = models.IntegerField(
+        'Число постов',
+        default=0,
+        editable=False
+    )
 
     def __str__(self) -> str:
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def feed(self):
+        """Посты для ленты: автор и группа одним JOIN, число комментариев
+        подзапросом, только нужные карточке колонки."""
+        return self.select_related('author', 'group').annotate(
+            comment_count=count_subquery(Comment, 'post')
+        ).only(*FEED_FIELDS)
+
+    def backfill_excerpts(self, batch_size=1000):
+        """Пересчитывает начала текста пачками, возвращает исправленные
+        посты: (pk, author_id, group_id)."""
+        fixed = []
+        batch = []
+        posts = self.order_by('pk').only(
+            'pk', 'author', 'group', 'text', 'excerpt', 'truncated'
+        )
+        for post in posts.iterator(chunk_size=batch_size):
+            stored = (post.excerpt, post.truncated)
+            post.fill_excerpt()
+            if (post.excerpt, post.truncated) != stored:
+                batch.append(post)
+                fixed.append((post.pk, post.author_id, post.group_id))
+            if len(batch) >= batch_size:
+                self.bulk_update(batch, ['excerpt', 'truncated'])
+                batch = []
+        if batch:
+            self.bulk_update(batch, ['excerpt', 'truncated'])
+        return fixed
+
+    def count(self):
+        """Считает строки без подзапросов ленты: они не меняют их число,
+        а Paginator иначе вычислял бы их для всей таблицы."""
+        annotations = self.query.annotations
+        if self._result_cache is not None or not any(
+            name in annotations for name in FEED_ANNOTATIONS
+        ):
+            return super().count()
+        clone = self._chain()
+        for name in FEED_ANNOTATIONS:
+            clone.query.annotations.pop(name, None)
+        clone.query.set_annotation_mask(clone.query.annotations)
+        return clone.query.get_count(using=self.db)
+
+
 class Post(models.Model):
     class Meta:
         ordering = ['-pub_date']
+        # Ленты фильтруют по автору или группе и сортируют по дате:
+        # составной индекс отдает страницу без сортировки всей выборки.
+        indexes = [
+            models.Index(fields=['-pub_date']),
+            models.Index(fields=['author', '-pub_date']),
+            models.Index(fields=['group', '-pub_date']),
+        ]
+
+    objects = PostQuerySet.as_manager()
 
     text = models.TextField()
+    excerpt = models.TextField(
+        'Начало текста',
+        blank=True,
+        editable=False
+    )
+    truncated = models.BooleanField(
+        'Текст обрезан',
+        default=False,
+        editable=False
+    )
     pub_date = models.DateTimeField(auto_now_add=True)
     author = models.ForeignKey(
         User,
@@ -40,8 +146,30 @@ class Post(models.Model):
     def __str__(self) -> str:
         return self.text[:15]
 
+    def fill_excerpt(self):
+        self.excerpt, self.truncated = make_excerpt(self.text)
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        # Незагруженный текст не менялся, пересчитывать нечего.
+        if 'text' not in self.get_deferred_fields() and (
+            update_fields is None or 'text' in update_fields
+        ):
+            self.fill_excerpt()
+            if update_fields is not None:
+                kwargs['update_fields'] = {
+                    *update_fields, 'excerpt', 'truncated',
+                }
+        super().save(*args, **kwargs)
+
 
 class Comment(models.Model):
+    class Meta:
+        ordering = ['created']
+        indexes = [
+            models.Index(fields=['post', 'created']),
+        ]
+
     text = models.TextField()
     created = models.DateTimeField(auto_now_add=True)
     author = models.ForeignKey(
@@ -70,3 +198,126 @@ class Follow(models.Model):
         on_delete=models.CASCADE,
         related_name='following',
     )
+
+
+class UserStatsManager(models.Manager):
+    def bump(self, user_id, **deltas):
+        """Атомарно сдвигает счетчики пользователя через F-выражения.
+
+        Если строки статистики еще нет, она пересчитывается с нуля после
+        фиксации транзакции: при каскадном удалении пользователя его
+        статистика удаляется раньше постов, и пересчет внутри транзакции
+        создал бы строку для пользователя, которого уже не будет.
+        """
+        updated = self.filter(user_id=user_id).update(**{
+            field: models.F(field) + delta for field, delta in deltas.items()
+        })
+        if not updated:
+            transaction.on_commit(lambda: self.recount(user_ids=[user_id]))
+
+    def recount(self, user_ids=None, batch_size=1000):
+        """Пересчитывает счетчики пачками, возвращает id пользователей,
+        чьи счетчики исправлены."""
+        users = User.objects.order_by('pk')
+        if user_ids is not None:
+            users = users.filter(pk__in=user_ids)
+        rows = users.annotate(
+            posts_total=count_subquery(Post, 'author'),
+            comments_total=count_subquery(Comment, 'author'),
+            followers_total=count_subquery(Follow, 'author'),
+            following_total=count_subquery(Follow, 'user'),
+        ).values_list(
+            'pk', 'posts_total', 'comments_total',
+            'followers_total', 'following_total',
+        )
+        fixed = []
+        batch = []
+        for row in rows.iterator(chunk_size=batch_size):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                fixed += self._save_batch(batch)
+                batch = []
+        if batch:
+            fixed += self._save_batch(batch)
+        return fixed
+
+    def _save_batch(self, rows):
+        current = self.in_bulk([row[0] for row in rows])
+        to_create = []
+        to_update = []
+        for user_id, *counts in rows:
+            stats = UserStats(user_id, *counts)
+            if user_id not in current:
+                to_create.append(stats)
+            elif current[user_id].counts() != stats.counts():
+                to_update.append(stats)
+        self.bulk_create(to_create)
+        self.bulk_update(to_update, UserStats.COUNTERS)
+        return [stats.user_id for stats in to_create + to_update]
+
+
+class UserStats(models.Model):
+    """Денормализованные счетчики пользователя для профиля и поста."""
+    COUNTERS = (
+        'posts_count',
+        'comments_count',
+        'followers_count',
+        'following_count',
+    )
+
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+    )
+    posts_count = models.IntegerField(default=0)
+    comments_count = models.IntegerField(default=0)
+    followers_count = models.IntegerField(default=0)
+    following_count = models.IntegerField(default=0)
+
+    objects = UserStatsManager()
+
+    def counts(self):
+        return tuple(getattr(self, field) for field in self.COUNTERS)
+
+
+class TimelineEntry(models.Model):
+    """Запись ленты подписок: пост автора, разложенный подписчику."""
+    class Meta:
+        ordering = ['-pub_date']
+        unique_together = ['user', 'post']
+        indexes = [
+            models.Index(fields=['user', '-pub_date']),
+        ]
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    pub_date = models.DateTimeField()
+
+
+class SearchTerm(models.Model):
+    """Строка обратного индекса для поиска без FTS5 (posts.search)."""
+    class Meta:
+        unique_together = ['term', 'post']
+
+    term = models.CharField(max_length=64)
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='search_terms',
+    )
+    frequency = models.IntegerField(default=1)
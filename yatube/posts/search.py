@@ -0,0 +1,210 @@
+"""Полнотекстовый поиск по постам.
+
+На SQLite используется виртуальная таблица FTS5 posts_search с
+ранжированием bm25, на остальных базах (или без FTS5) — обратный индекс
+в модели SearchTerm с ранжированием tf-idf. Оба индекса обновляются
+сигналами при сохранении и удалении поста; переключение бэкенда требует
+команды rebuild_search_index. Запросы к FTS5 идут в ту базу, которую
+роутер выбрал бы для Post, так что под replica_reads() поиск читает
+реплику.
+"""
+import math
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, connections, router
+from django.db.models import (
+    Case, Count, ExpressionWrapper, F, FloatField, Sum, Value, When,
+)
+
+from .models import Post, SearchTerm
+
+FTS_TABLE = 'posts_search'
+MAX_TERM_LENGTH = SearchTerm._meta.get_field('term').max_length
+WORD_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return [word[:MAX_TERM_LENGTH] for word in WORD_RE.findall(text.lower())]
+
+
+_fts_tables = {}
+
+
+def fts_available():
+    """Есть ли в базе таблица FTS5; ответ запоминается для каждой базы."""
+    if connection.vendor != 'sqlite':
+        return False
+    name = connection.settings_dict['NAME']
+    if name not in _fts_tables:
+        _fts_tables[name] = (
+            FTS_TABLE in connection.introspection.table_names()
+        )
+    return _fts_tables[name]
+
+
+class FtsBackend:
+    def read_cursor(self):
+        return connections[router.db_for_read(Post)].cursor()
+
+    def match(self, terms):
+        return ' '.join(f'"{term}"' for term in terms)
+
+    def count(self, terms):
+        with self.read_cursor() as cursor:
+            cursor.execute(
+                f'SELECT COUNT(*) FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s',
+                [self.match(terms)],
+            )
+            return cursor.fetchone()[0]
+
+    def ranked_ids(self, terms, offset, limit):
+        with self.read_cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                f'ORDER BY rank, rowid DESC LIMIT %s OFFSET %s',
+                [self.match(terms), limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def index(self, post_id, text):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id]
+            )
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, text) VALUES (%s, %s)',
+                [post_id, text],
+            )
+
+    def remove(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id]
+            )
+
+    def add(self, posts):
+        """Индексирует посты, которых еще нет в индексе, одним запросом."""
+        sql, params = posts.order_by().values_list(
+            'pk', 'text'
+        ).query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, text) {sql}', params
+            )
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        self.add(Post.objects.all())
+
+
+class InvertedIndexBackend:
+    def matches(self, terms):
+        """Посты со всеми словами запроса и суммой tf-idf или None."""
+        frequencies = dict(
+            SearchTerm.objects.filter(term__in=terms).values(
+                'term'
+            ).annotate(posts=Count('post')).values_list('term', 'posts')
+        )
+        if len(frequencies) < len(terms):
+            return None
+        total = Post.objects.count()
+        weights = [
+            When(term=term, then=Value(math.log(1 + total / posts)))
+            for term, posts in frequencies.items()
+        ]
+        return SearchTerm.objects.filter(term__in=terms).values(
+            'post'
+        ).annotate(
+            matched=Count('term'),
+            score=Sum(ExpressionWrapper(
+                F('frequency') * Case(*weights, output_field=FloatField()),
+                output_field=FloatField(),
+            )),
+        ).filter(matched=len(terms))
+
+    def count(self, terms):
+        matches = self.matches(terms)
+        return 0 if matches is None else matches.count()
+
+    def ranked_ids(self, terms, offset, limit):
+        matches = self.matches(terms)
+        if matches is None:
+            return []
+        return list(
+            matches.order_by('-score', '-post').values_list(
+                'post', flat=True
+            )[offset:offset + limit]
+        )
+
+    def index(self, post_id, text):
+        SearchTerm.objects.filter(post_id=post_id).delete()
+        SearchTerm.objects.bulk_create(
+            SearchTerm(term=term, post_id=post_id, frequency=frequency)
+            for term, frequency in Counter(tokenize(text)).items()
+        )
+
+    def remove(self, post_id):
+        SearchTerm.objects.filter(post_id=post_id).delete()
+
+    def add(self, posts, batch_size=1000):
+        """Индексирует посты, которых еще нет в индексе, пачками."""
+        batch = []
+        rows = posts.order_by().values_list('pk', 'text')
+        for post_id, text in rows.iterator(chunk_size=batch_size):
+            batch.extend(
+                SearchTerm(term=term, post_id=post_id, frequency=frequency)
+                for term, frequency in Counter(tokenize(text)).items()
+            )
+            if len(batch) >= batch_size:
+                SearchTerm.objects.bulk_create(batch)
+                batch = []
+        SearchTerm.objects.bulk_create(batch)
+
+    def rebuild(self, batch_size=1000):
+        SearchTerm.objects.all().delete()
+        self.add(Post.objects.all(), batch_size)
+
+
+def get_backend():
+    name = settings.SEARCH_BACKEND
+    if name == 'fts5' or (name == 'auto' and fts_available()):
+        return FtsBackend()
+    return InvertedIndexBackend()
+
+
+class SearchResults:
+    """Ленивая выдача поиска, которую можно передать в Paginator."""
+
+    def __init__(self, query, backend=None):
+        self.terms = list(dict.fromkeys(tokenize(query)))
+        self.backend = backend or get_backend()
+
+    def count(self):
+        if not self.terms:
+            return 0
+        return self.backend.count(self.terms)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        if not self.terms:
+            return []
+        start = key.start or 0
+        ids = self.backend.ranked_ids(self.terms, start, key.stop - start)
+        posts = Post.objects.feed().in_bulk(ids)
+        return [posts[post_id] for post_id in ids if post_id in posts]
+
+
+def index_post(post):
+    get_backend().index(post.pk, post.text)
+
+
+def remove_post(post_id):
+    get_backend().remove(post_id)
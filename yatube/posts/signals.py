@@ -0,0 +1,177 @@
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import search, timeline
+from .caching import bump_generation, profile_scope, post_scopes
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+# Поля пользователя, которые видны на страницах постов.
+USER_DISPLAY_FIELDS = ('username', 'first_name', 'last_name')
+
+
+def bump_group(group_id, delta):
+    if group_id is not None:
+        Group.objects.filter(pk=group_id).update(
+            posts_count=F('posts_count') + delta
+        )
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_group(sender, instance, raw=False, **kwargs):
+    """Запоминает прежнюю группу, чтобы перенести пост между счетчиками."""
+    if instance.pk is not None and not raw:
+        instance._stored_group_id = Post.objects.filter(
+            pk=instance.pk
+        ).values_list('group_id', flat=True).first()
+
+
+@receiver(post_save, sender=Post)
+def count_post(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        UserStats.objects.bump(instance.author_id, posts_count=1)
+        bump_group(instance.group_id, 1)
+        if timeline.enabled():
+            timeline.fan_out(instance)
+        return
+    stored_group_id = getattr(instance, '_stored_group_id', None)
+    if stored_group_id != instance.group_id:
+        bump_group(stored_group_id, -1)
+        bump_group(instance.group_id, 1)
+
+
+@receiver(post_delete, sender=Post)
+def uncount_post(sender, instance, **kwargs):
+    UserStats.objects.bump(instance.author_id, posts_count=-1)
+    bump_group(instance.group_id, -1)
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.bump(instance.author_id, comments_count=1)
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_comment(sender, instance, **kwargs):
+    UserStats.objects.bump(instance.author_id, comments_count=-1)
+
+
+@receiver(post_save, sender=Follow)
+def count_follow(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.bump(instance.user_id, following_count=1)
+        UserStats.objects.bump(instance.author_id, followers_count=1)
+        if timeline.enabled():
+            timeline.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def uncount_follow(sender, instance, **kwargs):
+    UserStats.objects.bump(instance.user_id, following_count=-1)
+    UserStats.objects.bump(instance.author_id, followers_count=-1)
+    if timeline.enabled():
+        timeline.remove(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_pages(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_generation(*post_scopes(instance))
+
+
+@receiver(post_save, sender=Group)
+def invalidate_group_pages(sender, instance, created, raw=False, **kwargs):
+    # Название группы показывают и ее страница, и страницы ее постов.
+    if raw or created:
+        return
+    post_ids = instance.posts.values_list('pk', flat=True)
+    bump_generation(
+        f'group:{instance.slug}',
+        *(f'post:{pk}' for pk in post_ids.iterator()),
+    )
+
+
+@receiver(pre_save, sender=User)
+def remember_user_names(sender, instance, raw=False, update_fields=None,
+                        **kwargs):
+    """Запоминает видимые на страницах поля, чтобы сравнить после save().
+
+    Вход сохраняет только last_login, такие сохранения не проверяются.
+    """
+    if instance.pk is None or raw or (
+        update_fields is not None
+        and not set(update_fields) & set(USER_DISPLAY_FIELDS)
+    ):
+        return
+    instance._stored_names = User.objects.filter(pk=instance.pk).values_list(
+        *USER_DISPLAY_FIELDS
+    ).first()
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_pages(sender, instance, created, raw=False, **kwargs):
+    stored = instance.__dict__.pop('_stored_names', None)
+    names = tuple(getattr(instance, field) for field in USER_DISPLAY_FIELDS)
+    if raw or created or stored is None or stored == names:
+        return
+    # Имя автора есть на карточках всех лент с его постами и на
+    # страницах его постов (они зависят от области профиля).
+    scopes = ['index', f'profile:{stored[0]}', f'profile:{instance.username}']
+    scopes += (
+        f'group:{slug}' for slug in Group.objects.filter(
+            posts__author=instance
+        ).values_list('slug', flat=True).distinct()
+    )
+    if stored[0] != instance.username:
+        # Под комментариями выводится имя пользователя.
+        scopes += (
+            f'post:{pk}' for pk in Comment.objects.filter(
+                author=instance
+            ).values_list('post_id', flat=True).distinct()
+        )
+    bump_generation(*scopes)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_pages(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    post = Post.objects.filter(pk=instance.post_id).only(
+        'author', 'group'
+    ).first()
+    scopes = profile_scope(instance.author_id)
+    if post is not None:
+        scopes += post_scopes(post)
+    bump_generation(*scopes)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow_pages(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_generation(
+            *profile_scope(instance.author_id),
+            *profile_scope(instance.user_id),
+        )
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    search.remove_post(instance.pk)
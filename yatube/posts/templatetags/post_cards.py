@@ -0,0 +1,92 @@
+import hashlib
+
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+
+from posts import thumbnails
+from posts.caching import increment
+
+register = template.Library()
+
+CARD_KEY = 'post_card:{}:{}'
+STATS_KEY = 'post_card:stats:{}:{}'
+
+
+def card_version(post):
+    """Хэш всего, что показывает карточка: меняется при любой правке."""
+    fields = (
+        post.excerpt,
+        post.truncated,
+        post.image.name,
+        post.pub_date.isoformat(),
+        post.author.username,
+        post.author.get_full_name(),
+        post.group.slug if post.group else '',
+        getattr(post, 'comment_count', ''),
+        thumbnails.ready_url(post.image.name) if post.image else '',
+    )
+    data = '\x1f'.join(str(field) for field in fields)
+    return hashlib.md5(data.encode()).hexdigest()
+
+
+def count(view_name, outcome):
+    increment(STATS_KEY.format(view_name, outcome))
+
+
+def card_cache_stats(view_name):
+    """Попадания и промахи кэша карточек для view."""
+    keys = {
+        outcome: STATS_KEY.format(view_name, outcome)
+        for outcome in ('hits', 'misses')
+    }
+    values = cache.get_many(keys.values())
+    return {outcome: values.get(key, 0) for outcome, key in keys.items()}
+
+
+@register.filter
+def ready_thumbnail(image, post_id=None):
+    """URL готовой миниатюры картинки или пустая строка, пока ее нет.
+
+    {{ post.image|ready_thumbnail:post.pk }}
+    """
+    if not image:
+        return ''
+    return thumbnails.ensure(image.name, post_id) or ''
+
+
+class CardCacheNode(template.Node):
+    def __init__(self, nodelist, post):
+        self.nodelist = nodelist
+        self.post = post
+
+    def render(self, context):
+        post = self.post.resolve(context)
+        request = context.get('request')
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else ''
+        key = CARD_KEY.format(post.pk, card_version(post))
+        html = cache.get(key)
+        if html is not None:
+            count(view_name, 'hits')
+            return html
+        count(view_name, 'misses')
+        html = self.nodelist.render(context)
+        cache.set(key, html, settings.POST_CARD_CACHE_TIMEOUT)
+        return html
+
+
+@register.tag
+def cache_card(parser, token):
+    """Кэширует отрисованную карточку поста.
+
+    {% cache_card post %} ... {% endcache_card %}
+    """
+    bits = token.split_contents()
+    if len(bits) != 2:
+        raise template.TemplateSyntaxError(
+            f'{bits[0]} принимает ровно один аргумент — пост.'
+        )
+    nodelist = parser.parse(('endcache_card',))
+    parser.delete_first_token()
+    return CardCacheNode(nodelist, parser.compile_filter(bits[1]))
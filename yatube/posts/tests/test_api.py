@@ -0,0 +1,134 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+from django.utils.http import http_date
+
+from ..models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class ApiTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        for num in range(settings.POSTS_PER_PAGE + 2):
+            Post.objects.create(
+                author=cls.user,
+                group=cls.group,
+                text=f'Тестовый пост номер {num}',
+            )
+        cls.post = Post.objects.latest('pub_date', 'pk')
+
+    def setUp(self):
+        cache.clear()
+        self.follower = User.objects.create_user(username='follower')
+        self.follower_client = Client()
+        self.follower_client.force_login(self.follower)
+        Follow.objects.create(user=self.follower, author=self.user)
+
+    def test_feeds_are_paginated_by_cursor(self):
+        """Все ленты API листаются курсором по ссылке next."""
+        urls = [
+            reverse('posts:api_index'),
+            reverse('posts:api_group_posts', kwargs={'slug': 'test-slug'}),
+            reverse('posts:api_profile', kwargs={'username': 'auth'}),
+            reverse('posts:api_follow_index'),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                data = self.follower_client.get(url).json()
+                self.assertEqual(len(data['results']),
+                                 settings.POSTS_PER_PAGE)
+                self.assertEqual(data['results'][0]['id'], self.post.pk)
+                self.assertEqual(data['results'][0]['group'], 'test-slug')
+                data = self.follower_client.get(data['next']).json()
+                self.assertEqual(len(data['results']), 2)
+                self.assertIsNone(data['next'])
+
+    def test_follow_feed_requires_login(self):
+        """Лента подписок без входа отвечает 401, а не редиректом."""
+        response = self.client.get(reverse('posts:api_follow_index'))
+        self.assertEqual(response.status_code, 401)
+
+    def test_post_detail_with_comments(self):
+        """Пост отдается с полным текстом и страницей комментариев."""
+        Comment.objects.create(
+            post=self.post, author=self.follower, text='Комментарий'
+        )
+        data = self.client.get(
+            reverse('posts:api_post_detail', kwargs={'post_id': self.post.pk})
+        ).json()
+        self.assertEqual(data['text'], self.post.text)
+        self.assertEqual(data['comment_count'], 1)
+        self.assertEqual(
+            [comment['text'] for comment in data['comments']],
+            ['Комментарий'],
+        )
+
+    def test_post_detail_loads_text_with_the_post(self):
+        """Полный текст читается вместе с постом, без отдельного запроса."""
+        url = reverse(
+            'posts:api_post_detail', kwargs={'post_id': self.post.pk}
+        )
+        self.client.get(url)
+        # Пост и страница комментариев; дата изменения уже в кэше.
+        with self.assertNumQueries(2):
+            data = self.client.get(url).json()
+        self.assertEqual(data['text'], self.post.text)
+
+    def test_unchanged_feed_is_not_modified(self):
+        """Повторный запрос с ETag получает 304 без выборки ленты."""
+        url = reverse('posts:api_index')
+        response = self.client.get(url)
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_edit_is_not_hidden_by_if_modified_since(self):
+        """Правка не двигает дату поста, поэтому Last-Modified не отдается."""
+        url = reverse('posts:api_index')
+        response = self.client.get(url)
+        self.assertFalse(response.has_header('Last-Modified'))
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Правка'
+        post.save()
+        response = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=http_date(time.time())
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_changes_with_content(self):
+        """Правка поста и новый комментарий меняют ETag."""
+        urls = [
+            reverse('posts:api_index'),
+            reverse('posts:api_post_detail', kwargs={'post_id': self.post.pk}),
+        ]
+        etags = {url: self.client.get(url)['ETag'] for url in urls}
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Исправленный текст'
+        post.save()
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(
+                    url, HTTP_IF_NONE_MATCH=etags[url]
+                )
+                self.assertEqual(response.status_code, 200)
+                etags[url] = response['ETag']
+        Comment.objects.create(
+            post=self.post, author=self.follower, text='Комментарий'
+        )
+        url = urls[1]
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etags[url])
+        self.assertEqual(response.status_code, 200)
@@ -1,15 +1,30 @@
 import shutil
 import tempfile
+from io import BytesIO, StringIO
 
 from django.contrib.auth import get_user_model
 from posts.models import Post, Comment
 from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
+
+from ..caching import get_generation
 
 User = get_user_model()
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
 
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
@@ -66,10 +81,97 @@ class PostFormTests(TestCase):
             Post.objects.filter(
                 author=PostFormTests.user,
                 text='Тестовый пост',
-                image='posts/small.gif'
+                image='posts/small.jpg'
             ).exists()
         )
 
+    def test_uploaded_image_is_normalized(self):
+        """Картинка уменьшается, теряет EXIF и сохраняется в JPEG."""
+        source = Image.new('RGBA', (4000, 1000), (255, 0, 0, 128))
+        exif = Image.Exif()
+        exif[0x010F] = 'Тестовая камера'
+        buffer = BytesIO()
+        source.save(buffer, 'PNG', exif=exif)
+        uploaded = SimpleUploadedFile(
+            name='big.png',
+            content=buffer.getvalue(),
+            content_type='image/png'
+        )
+        self.post_author.post(
+            reverse('posts:post_create'),
+            data={'text': 'Большая картинка', 'image': uploaded},
+        )
+        post = Post.objects.get(text='Большая картинка')
+        self.assertEqual(post.image.name, 'posts/big.jpg')
+        with Image.open(post.image.path) as stored:
+            self.assertEqual(stored.format, 'JPEG')
+            self.assertEqual(stored.size, (1920, 480))
+            self.assertFalse(stored.getexif())
+        self.assertLess(post.image.size, len(buffer.getvalue()))
+
+    @override_settings(POST_IMAGE_MAX_UPLOAD_SIZE=20)
+    def test_oversized_image_is_rejected(self):
+        """Слишком большая картинка отклоняется с ошибкой формы."""
+        posts_count = Post.objects.count()
+        uploaded = SimpleUploadedFile(
+            name='small.gif',
+            content=SMALL_GIF,
+            content_type='image/gif'
+        )
+        response = self.post_author.post(
+            reverse('posts:post_create'),
+            data={'text': 'Тестовый пост', 'image': uploaded},
+        )
+        self.assertFormError(response, 'form', 'image',
+                             'Картинка больше 20\xa0байт.')
+        self.assertEqual(Post.objects.count(), posts_count)
+        self.assertEqual(response.wsgi_request.rejected_uploads, {'image'})
+
+    def test_truncated_image_is_rejected(self):
+        """Обрезанная картинка дает ошибку формы, а не ошибку сервера."""
+        buffer = BytesIO()
+        Image.new('RGB', (500, 500), 'red').save(buffer, 'JPEG')
+        uploaded = SimpleUploadedFile(
+            name='broken.jpg',
+            content=buffer.getvalue()[:len(buffer.getvalue()) // 2],
+            content_type='image/jpeg'
+        )
+        response = self.post_author.post(
+            reverse('posts:post_create'),
+            data={'text': 'Битая картинка', 'image': uploaded},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['form'].has_error(
+            'image', 'invalid_image'
+        ))
+        self.assertFalse(Post.objects.filter(text='Битая картинка').exists())
+
+    def test_normalize_images_refreshes_cached_pages(self):
+        """Команда перекодирует старую картинку и сбрасывает кэш страниц."""
+        buffer = BytesIO()
+        Image.new('RGB', (3000, 3000), 'red').save(buffer, 'PNG')
+        name = default_storage.save('posts/old.png', ContentFile(
+            buffer.getvalue()
+        ))
+        post = Post.objects.create(author=self.user, text='Старая', image=name)
+        scope = f'post:{post.pk}'
+        generation = get_generation(scope)
+        call_command('normalize_images', apply=True, stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.image.name, 'posts/old.jpg')
+        self.assertFalse(default_storage.exists(name))
+        self.assertNotEqual(get_generation(scope), generation)
+
+    def test_upload_views_still_check_csrf(self):
+        """Лимит загрузки не отключает проверку CSRF."""
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        response = client.post(
+            reverse('posts:post_create'), data={'text': 'Без токена'}
+        )
+        self.assertTemplateUsed(response, 'core/403csrf.html')
+        self.assertFalse(Post.objects.filter(text='Без токена').exists())
+
     def test_edit_post(self):
         """Валидная форма редактирует запись в базе данных."""
         post_to_edit = Post.objects.create(
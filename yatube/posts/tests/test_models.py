@@ -1,7 +1,21 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 
-from ..models import Group, Post
+from .. import fake_data, loading, search
+from ..caching import get_generation
+from ..models import Comment, Follow, Group, Post, UserStats
 
 User = get_user_model()
 
@@ -32,3 +46,355 @@ class PostModelTest(TestCase):
         post = PostModelTest.post
         expected_object_name = post.text
         self.assertEqual(expected_object_name, str(post))
+
+
+class PostExcerptTest(TestCase):
+    """Начало текста для лент считается при сохранении поста."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.long_text = 'слово ' * settings.FEED_TEXT_LENGTH
+
+    def test_excerpt_is_computed_on_save(self):
+        """save() заполняет начало текста и признак обрезки."""
+        post = Post.objects.create(author=self.user, text='Коротко')
+        self.assertEqual((post.excerpt, post.truncated), ('Коротко', False))
+        post.text = self.long_text
+        post.save(update_fields=['text'])
+        post.refresh_from_db()
+        self.assertTrue(post.truncated)
+        self.assertEqual(len(post.excerpt), settings.FEED_TEXT_LENGTH)
+        self.assertTrue(self.long_text.startswith(post.excerpt[:-1]))
+        self.assertTrue(post.excerpt.endswith('…'))
+
+    def test_backfill_command_fixes_stale_excerpts(self):
+        """backfill_excerpts исправляет устаревшие начала текста."""
+        post = Post.objects.create(author=self.user, text='Пост')
+        Post.objects.filter(pk=post.pk).update(text=self.long_text)
+        out = StringIO()
+        call_command('backfill_excerpts', stdout=out)
+        self.assertIn('Исправлено начал текста: 1.', out.getvalue())
+        post.refresh_from_db()
+        self.assertTrue(post.truncated)
+        call_command('backfill_excerpts', stdout=out)
+        self.assertIn('Исправлено начал текста: 0.', out.getvalue())
+
+    def test_backfill_bumps_only_feed_pages(self):
+        """Исправление начал текста сбрасывает ленты, но не страницы постов."""
+        post = Post.objects.create(author=self.user, text='Пост')
+        Post.objects.filter(pk=post.pk).update(text=self.long_text)
+        scopes = ['index', f'profile:{self.user.username}', f'post:{post.pk}']
+        before = [get_generation(scope) for scope in scopes]
+        call_command('backfill_excerpts', stdout=StringIO())
+        after = [get_generation(scope) for scope in scopes]
+        self.assertEqual(
+            [old != new for old, new in zip(before, after)],
+            [True, True, False],
+        )
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN из SQLite')
+class FeedIndexesTest(TestCase):
+    """Ленты читают посты по индексам, а не полным просмотром таблиц."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        Follow.objects.create(user=cls.reader, author=cls.user)
+        for num in range(3):
+            post = Post.objects.create(
+                author=cls.user, group=cls.group, text=f'Пост {num}'
+            )
+            Comment.objects.create(post=post, author=cls.reader, text='Да')
+        cls.post = post
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+
+    def full_scans(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            details = [row[-1] for row in cursor.fetchall()]
+        return [
+            detail for detail in details
+            if detail.startswith('SCAN')
+            and 'USING' not in detail
+            and 'SUBQUERY' not in detail
+            and 'CONSTANT ROW' not in detail
+        ]
+
+    def test_list_views_use_indexes(self):
+        """Запросы лент к таблицам posts не просматривают их целиком."""
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+            reverse('posts:follow_index'),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        ]
+        for url in urls:
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(url)
+            for query in queries.captured_queries:
+                if 'posts_' not in query['sql']:
+                    continue
+                with self.subTest(url=url, sql=query['sql']):
+                    self.assertEqual(self.full_scans(query['sql']), [])
+
+
+class StatsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.other_group = Group.objects.create(
+            title='Другая группа',
+            slug='other-slug',
+            description='Тестовое описание',
+        )
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user).counts()
+
+    def test_counters_follow_creates_and_deletes(self):
+        """Счетчики меняются при создании и удалении объектов."""
+        post = Post.objects.create(
+            author=self.user, group=self.group, text='Пост'
+        )
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='Да'
+        )
+        follow = Follow.objects.create(user=self.reader, author=self.user)
+        self.assertEqual(self.stats(self.user), (1, 0, 1, 0))
+        self.assertEqual(self.stats(self.reader), (0, 1, 0, 1))
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 1)
+        comment.delete()
+        follow.delete()
+        post.delete()
+        self.assertEqual(self.stats(self.user), (0, 0, 0, 0))
+        self.assertEqual(self.stats(self.reader), (0, 0, 0, 0))
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 0)
+
+    def test_user_with_posts_can_be_deleted(self):
+        """Удаление автора не пересоздает его статистику."""
+        author = User.objects.create_user(username='leaving')
+        post = Post.objects.create(author=author, text='Пост')
+        Comment.objects.create(post=post, author=author, text='Да')
+        author_id = author.pk
+        author.delete()
+        self.assertFalse(UserStats.objects.filter(user_id=author_id).exists())
+        self.assertFalse(Post.objects.filter(pk=post.pk).exists())
+
+    def test_group_counter_follows_post_move(self):
+        """Перенос поста в другую группу переносит его в счетчиках."""
+        post = Post.objects.create(
+            author=self.user, group=self.group, text='Пост'
+        )
+        post.group = self.other_group
+        post.save()
+        self.group.refresh_from_db()
+        self.other_group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 0)
+        self.assertEqual(self.other_group.posts_count, 1)
+
+    def test_recount_command_fixes_drift(self):
+        """Команда recount_stats исправляет разошедшиеся счетчики."""
+        Post.objects.create(author=self.user, group=self.group, text='Пост')
+        UserStats.objects.filter(user=self.user).update(posts_count=42)
+        UserStats.objects.filter(user=self.reader).delete()
+        Group.objects.filter(pk=self.group.pk).update(posts_count=7)
+        scopes = [f'profile:{self.user.username}', f'group:{self.group.slug}']
+        before = [get_generation(scope) for scope in scopes]
+        call_command('recount_stats', stdout=StringIO())
+        for scope, generation in zip(scopes, before):
+            with self.subTest(scope=scope):
+                self.assertNotEqual(get_generation(scope), generation)
+        self.assertEqual(self.stats(self.user), (1, 0, 0, 0))
+        self.assertEqual(self.stats(self.reader), (0, 0, 0, 0))
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 1)
+
+
+class BenchmarkTest(TestCase):
+    def test_generator_fills_consistent_data(self):
+        """Сгенерированные данные согласованы со счетчиками."""
+        fake_data.Generator(seed=1, batch_size=50).generate(
+            users=20, groups=3, posts=200, follows=40, comments=100
+        )
+        loading.refresh()
+        self.assertEqual(User.objects.count(), 20)
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertEqual(Comment.objects.count(), 100)
+        self.assertEqual(
+            Post.objects.values('pub_date').distinct().count(), 200
+        )
+        for user in User.objects.select_related('stats'):
+            self.assertEqual(user.stats.posts_count, user.posts.count())
+        for group in Group.objects.all():
+            self.assertEqual(group.posts_count, group.posts.count())
+
+    def test_benchmark_views_writes_report(self):
+        """benchmark_views пишет JSON-отчет по всем view и режимам."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'report.json')
+            call_command(
+                'benchmark_views', generate=True, users=10, groups=2,
+                posts=50, follows=20, comments=20, requests=2, output=path,
+                stdout=StringIO(), stderr=StringIO(),
+            )
+            with open(path, encoding='utf-8') as file:
+                report = json.load(file)
+        self.assertEqual(report['dataset']['post'], 50)
+        self.assertEqual(set(report['views']), {
+            'index', 'group_posts', 'profile', 'post_detail',
+            'follow_index', 'add_comment',
+        })
+        self.assertEqual(set(report['views']['index']), {'cold', 'warm'})
+        # Прогретые страницы, в том числе допускаемые в кэш не сразу,
+        # отдаются из кэша.
+        for name in ('index', 'post_detail'):
+            self.assertEqual(report['views'][name]['warm']['queries_max'], 0)
+        self.assertEqual(Comment.objects.count(), 20)
+
+
+class ImportDataTest(TestCase):
+    def write(self, directory, name, content):
+        path = os.path.join(directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def test_full_refresh_resets_page_cache(self):
+        """Полный пересчет после generate_data сбрасывает кэш всех страниц."""
+        user = User.objects.create_user(username='auth')
+        group = Group.objects.create(title='Группа', slug='group')
+        post = Post.objects.create(author=user, group=group, text='Пост')
+        scopes = ['index', 'profile:auth', 'group:group', f'post:{post.pk}']
+        before = [get_generation(scope) for scope in scopes]
+        loading.refresh()
+        for scope, generation in zip(scopes, before):
+            with self.subTest(scope=scope):
+                self.assertNotEqual(get_generation(scope), generation)
+
+    def test_imported_users_get_unusable_passwords(self):
+        """Хэш пароля из файла не загружается."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = self.write(directory, 'users.jsonl', (
+                '{"username": "auth", "password": "md5$salt$hash"}\n'
+            ))
+            call_command('import_data', path, model='user', stdout=StringIO())
+        user = User.objects.get(username='auth')
+        self.assertFalse(user.has_usable_password())
+        self.assertNotIn('hash', user.password)
+
+    def test_import_streams_files_and_refreshes(self):
+        """Загрузка по файлам пересчитывает счетчики затронутых строк."""
+        with tempfile.TemporaryDirectory() as directory:
+            files = [
+                ('user', self.write(directory, 'users.jsonl', (
+                    '{"username": "auth", "first_name": "Лев"}\n'
+                    '{"username": "reader"}\n'
+                ))),
+                ('group', self.write(directory, 'groups.csv', (
+                    'title,slug,description\n'
+                    'Группа,test-slug,Описание\n'
+                ))),
+                ('post', self.write(directory, 'posts.jsonl', (
+                    '{"author": "auth", "group": "test-slug", '
+                    '"text": "Старый пост", '
+                    '"pub_date": "2020-01-02T03:04:05"}\n'
+                    '{"author": "auth", "text": "Новый пост"}\n'
+                    '{"author": "nobody", "text": "Без автора"}\n'
+                ))),
+                ('follow', self.write(directory, 'follows.csv', (
+                    'user,author\nreader,auth\nreader,reader\n'
+                ))),
+            ]
+            out = StringIO()
+            for model, path in files:
+                call_command('import_data', path, model=model,
+                             batch_size=1, stdout=out)
+            post = Post.objects.get(text='Старый пост')
+            comments = self.write(directory, 'comments.jsonl', (
+                f'{{"post": {post.pk}, "author": "reader", "text": "Да"}}\n'
+            ))
+            call_command('import_data', comments, model='comment',
+                         stdout=out)
+        self.assertIn('пропущено: 1', out.getvalue())
+        self.assertEqual(post.pub_date.year, 2020)
+        self.assertEqual(post.group.slug, 'test-slug')
+        self.assertEqual(post.comments.count(), 1)
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertEqual(Follow.objects.count(), 1)
+        author = User.objects.get(username='auth')
+        self.assertEqual(UserStats.objects.get(user=author).counts(),
+                         (2, 0, 1, 0))
+        self.assertEqual(Group.objects.get().posts_count, 1)
+
+    def test_malformed_rows_are_skipped(self):
+        """Неполные и неверные строки пропускаются, а не прерывают загрузку."""
+        author = User.objects.create_user(username='auth')
+        post = Post.objects.create(author=author, text='Пост')
+        with tempfile.TemporaryDirectory() as directory:
+            posts = self.write(directory, 'posts.jsonl', (
+                '{"author": "auth", "text": "Годный пост"}\n'
+                '{"text": "Без автора"}\n'
+                '{"author": "auth"}\n'
+                '{"author": "auth", "text": "Дата", "pub_date": "вчера"}\n'
+                '{"author": "auth", "text": "обрыв\n'
+                '["не", "словарь"]\n'
+            ))
+            comments = self.write(directory, 'comments.csv', (
+                'post,author,text\n'
+                f'{post.pk},auth,Да\n'
+                'abc,auth,Нет\n'
+                f'{post.pk},auth\n'
+            ))
+            out = StringIO()
+            call_command('import_data', posts, model='post', batch_size=2,
+                         stdout=out)
+            call_command('import_data', comments, model='comment',
+                         stdout=out)
+        self.assertIn('Загружено строк: 1, пропущено: 5', out.getvalue())
+        self.assertIn('Загружено строк: 1, пропущено: 2', out.getvalue())
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertEqual(post.comments.count(), 1)
+
+    def test_refresh_covers_only_loaded_rows(self):
+        """После загрузки пересчитывается и сбрасывается только новое."""
+        User.objects.create_user(username='auth')
+        index = reverse('posts:index')
+        self.client.get(index)
+        with tempfile.TemporaryDirectory() as directory:
+            posts = self.write(directory, 'posts.jsonl', (
+                '{"author": "auth", "text": "Загруженный пост"}\n'
+            ))
+            with mock.patch.object(search.FtsBackend, 'rebuild') as fts, \
+                    mock.patch.object(search.InvertedIndexBackend,
+                                      'rebuild') as inverted:
+                call_command('import_data', posts, model='post',
+                             stdout=StringIO())
+        self.assertFalse(fts.called or inverted.called)
+        self.assertContains(self.client.get(index), 'Загруженный пост')
+        results = search.SearchResults('загруженный')
+        self.assertEqual([post.excerpt for post in results[:1]],
+                         ['Загруженный пост'])
+        self.assertEqual(UserStats.objects.get(user__username='auth').counts(),
+                         (1, 0, 0, 0))
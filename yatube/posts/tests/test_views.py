@@ -1,14 +1,46 @@
+import csv
+import io
+import json
+import shutil
+import tempfile
+import time
+from unittest import mock
+
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase
+from django.db import connection, router
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django import forms
 from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.cache import cache
+from django.core.management import call_command
+
+from core.db import replica_reads, reset_routing
 
-from ..models import Group, Post, Follow
+from .. import search, thumbnails
+from ..caching import (
+    Revalidation, bump_generation, cache_page_versioned, conditional,
+    get_generation, page_cache_stats, shell_key,
+)
+from ..feed import FeedRows, PostRow
+from ..models import Comment, Group, Post, Follow, TimelineEntry
+from ..templatetags.post_cards import card_cache_stats
+from ..utils import page_key
 
 User = get_user_model()
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
 
 
 class PostModelTest(TestCase):
@@ -133,26 +165,53 @@ class PostModelTest(TestCase):
                 first_object = response.context['page_obj'][0]
                 self.assertEqual(first_object, new_post)
 
-    def test_deleted_post_stays_in_index_cashe(self):
-        """Удаленный из базы данных пост остается в response.content"""
+    def test_index_is_served_from_cache(self):
+        """Повторный запрос главной страницы не обращается к базе."""
+        response_one = self.guest_client.get(reverse('posts:index')).content
+        with self.assertNumQueries(0):
+            response_two = (
+                self.guest_client.get(reverse('posts:index')).content
+            )
+        self.assertEqual(response_one, response_two)
+
+    def test_deleted_post_invalidates_cached_pages(self):
+        """Удаление поста сразу сбрасывает кэш страниц, где он был."""
         self.test_post = Post.objects.create(
             author=self.user,
             group=self.group,
             text='Тестовый пост для кэша'
         )
-        response_one = (
-            self.authorized_client.get(reverse('posts:index')).content
-        )
+        reverse_names = [
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+        ]
+        for reverse_name in reverse_names:
+            with self.subTest(reverse_name=reverse_name):
+                response = self.authorized_client.get(reverse_name)
+                self.assertContains(response, 'Тестовый пост для кэша')
         self.test_post.delete()
-        response_two = (
-            self.authorized_client.get(reverse('posts:index')).content
-        )
-        self.assertEqual(response_one, response_two)
-        cache.clear()
-        response_three = (
-            self.authorized_client.get(reverse('posts:index')).content
+        for reverse_name in reverse_names:
+            with self.subTest(reverse_name=reverse_name):
+                response = self.authorized_client.get(reverse_name)
+                self.assertNotContains(response, 'Тестовый пост для кэша')
+
+    def test_comment_invalidates_only_its_pages(self):
+        """Комментарий сбрасывает кэш группы поста, но не чужой группы."""
+        Group.objects.create(
+            title='Другая группа',
+            slug='other-slug',
+            description='Тестовое описание',
         )
-        self.assertNotEqual(response_three, response_one)
+        other_url = reverse('posts:group_posts', kwargs={'slug': 'other-slug'})
+        own_url = reverse('posts:group_posts', kwargs={'slug': 'test-slug'})
+        self.guest_client.get(other_url)
+        own_before = self.guest_client.get(own_url).content
+        Comment.objects.create(post=self.post, author=self.user, text='Да')
+        with self.assertNumQueries(0):
+            self.guest_client.get(other_url)
+        self.assertNotEqual(self.guest_client.get(own_url).content,
+                            own_before)
 
 
 class FollowModelTest(TestCase):
@@ -269,3 +328,965 @@ class PaginatorViewsTest(TestCase):
                 response = self.client.get(reverse_name + '?page=2')
                 self.assertEqual(len(response.context['page_obj']),
                                  PaginatorViewsTest.PAGE_TEST_OFFSET)
+
+
+@override_settings(CURSOR_PAGINATION_VIEWS=(
+    'posts:index', 'posts:group_posts', 'posts:profile',
+))
+class CursorPaginatorViewsTest(TestCase):
+    PAGE_TEST_OFFSET = 2
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        for num in range(settings.POSTS_PER_PAGE
+                         + CursorPaginatorViewsTest.PAGE_TEST_OFFSET):
+            Post.objects.create(
+                author=cls.user,
+                group=cls.group,
+                text=f'Тестовый пост номер {num}',
+            )
+        cls.reverse_names = [
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'auth'}),
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cursor_pages_walk_forward_and_back(self):
+        """Курсоры ведут на следующую и обратно на первую страницу."""
+        for reverse_name in self.reverse_names:
+            with self.subTest(reverse_name=reverse_name):
+                first = self.client.get(reverse_name).context['page_obj']
+                self.assertEqual(len(first), settings.POSTS_PER_PAGE)
+                self.assertFalse(first.has_previous())
+                second = self.client.get(
+                    f'{reverse_name}?cursor={first.next_cursor}'
+                ).context['page_obj']
+                self.assertEqual(len(second),
+                                 CursorPaginatorViewsTest.PAGE_TEST_OFFSET)
+                self.assertFalse(second.has_next())
+                back = self.client.get(
+                    f'{reverse_name}?cursor={second.previous_cursor}'
+                ).context['page_obj']
+                self.assertEqual(list(back), list(first))
+                self.assertFalse(back.has_previous())
+
+    def test_cursor_pages_do_not_overlap(self):
+        """Страницы курсора не пересекаются и идут от новых к старым."""
+        first = self.client.get(reverse('posts:index')).context['page_obj']
+        second = self.client.get(
+            reverse('posts:index') + f'?cursor={first.next_cursor}'
+        ).context['page_obj']
+        posts = list(first) + list(second)
+        self.assertEqual(posts, list(Post.objects.order_by('-pub_date',
+                                                           '-pk')))
+
+    def test_cursor_page_does_not_count(self):
+        """Курсорная страница не выполняет COUNT(*)."""
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('posts:index'))
+        self.assertFalse(any(
+            'COUNT(*)' in query['sql'] for query in queries.captured_queries
+        ))
+
+    def test_broken_cursor_shows_first_page(self):
+        """Битый курсор показывает первую страницу."""
+        response = self.client.get(reverse('posts:index') + '?cursor=abc')
+        self.assertEqual(len(response.context['page_obj']),
+                         settings.POSTS_PER_PAGE)
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.user,
+            group=cls.group,
+            text='Тестовый пост',
+        )
+        cls.pages = {
+            reverse('posts:index'): 'posts/index.html',
+            reverse('posts:group_posts', kwargs={'slug': 'test-slug'}):
+                'posts/group_list.html',
+            reverse('posts:profile', kwargs={'username': 'auth'}):
+                'posts/profile.html',
+            reverse('posts:post_detail', kwargs={'post_id': cls.post.pk}):
+                'posts/post_detail.html',
+        }
+
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user(username='reader')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+
+    def test_matching_etag_skips_rendering(self):
+        """При совпавшем If-None-Match шаблон не рендерится."""
+        for url, template in self.pages.items():
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                with self.assertNumQueries(0):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertTemplateNotUsed(response, template)
+                self.assertEqual(response.content, b'')
+
+    def test_etag_changes_with_content(self):
+        """Комментарий меняет ETag страниц, где виден пост."""
+        etags = {url: self.client.get(url)['ETag'] for url in self.pages}
+        Comment.objects.create(post=self.post, author=self.user, text='Да')
+        for url, template in self.pages.items():
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etags[url])
+                self.assertEqual(response.status_code, 200)
+                self.assertTemplateUsed(response, template)
+
+    def test_etag_depends_on_user_and_follow_state(self):
+        """ETag у каждого пользователя свой и меняется с подпиской."""
+        url = reverse('posts:profile', kwargs={'username': 'auth'})
+        guest_etag = self.client.get(url)['ETag']
+        response = self.authorized_client.get(url)
+        self.assertNotEqual(response['ETag'], guest_etag)
+        etag = response['ETag']
+        Follow.objects.create(user=self.reader, author=self.user)
+        response = self.authorized_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['following'])
+
+    def test_group_edit_changes_etag(self):
+        """Правка группы меняет ETag ее страницы и страниц ее постов."""
+        urls = [
+            reverse('posts:group_posts', kwargs={'slug': 'test-slug'}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        ]
+        etags = {url: self.client.get(url)['ETag'] for url in urls}
+        self.group.title = 'Новое название'
+        self.group.save()
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etags[url])
+                self.assertEqual(response.status_code, 200)
+                self.assertContains(response, 'Новое название')
+
+    def test_author_name_edit_changes_etag(self):
+        """Смена имени автора меняет ETag всех страниц с его постами."""
+        etags = {url: self.client.get(url)['ETag'] for url in self.pages}
+        self.user.first_name = 'Лев'
+        self.user.save()
+        for url in self.pages:
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etags[url])
+                self.assertEqual(response.status_code, 200)
+                self.assertContains(response, 'Лев')
+
+    def test_login_keeps_etag(self):
+        """Вход пользователя не сбрасывает кэш лент."""
+        url = reverse('posts:index')
+        self.reader.set_password('password')
+        self.reader.save()
+        self.client.login(username='reader', password='password')
+        etag = self.client.get(url)['ETag']
+        self.client.login(username='reader', password='password')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+
+class HolePunchingTest(TestCase):
+    """Страница кэшируется одна на всех, фрагменты — у каждого свои."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+
+    def test_header_is_rendered_for_each_user(self):
+        """Шапка из общей оболочки заполняется для каждого пользователя."""
+        url = reverse('posts:index')
+        self.assertNotContains(self.client.get(url), 'Пользователь:')
+        with self.assertNumQueries(0):
+            response = self.reader_client.get(url)
+        self.assertContains(response, 'Пользователь: reader')
+        self.assertNotContains(response, '<!--hole:')
+        response = self.author_client.get(url)
+        self.assertContains(response, 'Пользователь: auth')
+        self.assertNotContains(response, 'reader')
+
+    def test_comment_form_is_not_shared(self):
+        """Форма комментария с CSRF-токеном не попадает в общий кэш."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        self.assertNotContains(self.client.get(url), 'csrfmiddlewaretoken')
+        response = self.reader_client.get(url)
+        self.assertContains(response, 'Добавить комментарий')
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        self.assertTemplateUsed(response, 'posts/includes/comment_form.html')
+
+    def test_follow_button_reflects_current_user(self):
+        """Кнопка подписки отражает текущего пользователя."""
+        url = reverse('posts:profile', kwargs={'username': 'auth'})
+        self.assertContains(self.client.get(url), 'Подписаться')
+        response = self.reader_client.get(url)
+        self.assertContains(response, 'Отписаться')
+        self.assertTrue(response.context['following'])
+        response = self.author_client.get(url)
+        self.assertNotContains(response, 'Подписаться')
+        self.assertNotContains(response, 'Отписаться')
+
+    def test_switcher_is_not_shared(self):
+        """Вкладки лент из оболочки гостя видны вошедшему и наоборот."""
+        url = reverse('posts:index')
+        follow_url = reverse('posts:follow_index')
+        self.assertNotContains(self.client.get(url), follow_url)
+        response = self.reader_client.get(url)
+        self.assertContains(response, follow_url)
+        self.assertContains(response, 'nav-link active')
+        cache.clear()
+        self.reader_client.get(url)
+        self.assertNotContains(self.client.get(url), follow_url)
+
+
+class PageCacheStampedeTest(TestCase):
+    """Устаревшую страницу перестраивает один запрос, остальным — старая."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        Post.objects.create(author=cls.user, text='Старый пост')
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('posts:index')
+
+    def busy(self):
+        """Как будто страницу уже перестраивает другой запрос."""
+        return mock.patch.object(Revalidation, 'acquire', return_value=False)
+
+    def test_stale_page_is_served_during_revalidation(self):
+        """Пока страницу перестраивают, остальные получают старую версию."""
+        self.client.get(self.url)
+        Post.objects.create(author=self.user, text='Новый пост')
+        with self.busy():
+            response = self.client.get(self.url)
+        self.assertContains(response, 'Старый пост')
+        self.assertNotContains(response, 'Новый пост')
+        self.assertTrue(response['ETag'].startswith('"stale-'))
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Новый пост')
+        self.assertEqual(
+            page_cache_stats('index_page'),
+            {'hits': 0, 'misses': 2, 'stale': 1, 'waits': 0,
+             'rejected': 0, 'evicted': 0},
+        )
+
+    def test_page_is_revalidated_after_soft_timeout(self):
+        """После мягкого TTL страница перестраивается и без смены поколения."""
+        self.client.get(self.url)
+        Post.objects.filter(text='Старый пост').update(
+            text='Правка', excerpt='Правка'
+        )
+        self.assertContains(self.client.get(self.url), 'Старый пост')
+        later = time.time() + settings.PAGE_CACHE_TIMEOUT + 1
+        with mock.patch('time.time', return_value=later):
+            with self.busy():
+                self.assertContains(self.client.get(self.url), 'Старый пост')
+            self.assertContains(self.client.get(self.url), 'Правка')
+        self.assertEqual(page_cache_stats('index_page')['stale'], 1)
+
+    @override_settings(PAGE_CACHE_LOCK_WAIT=0.1)
+    def test_request_without_stale_copy_renders_after_waiting(self):
+        """Без старой копии запрос ждет перестройку, а затем строит сам."""
+        with self.busy():
+            response = self.client.get(self.url)
+        self.assertContains(response, 'Старый пост')
+        self.assertEqual(page_cache_stats('index_page')['misses'], 1)
+
+    def test_revalidation_lock_is_exclusive(self):
+        """Блокировку перестройки держит только один запрос."""
+        first, second = Revalidation('page'), Revalidation('page')
+        self.assertTrue(first.acquire())
+        self.assertFalse(second.acquire())
+        first.release()
+        self.assertTrue(second.acquire())
+        second.release()
+        # Блокировка другого процесса видна через кэш.
+        cache.add('posts:lock:page', 1)
+        self.assertFalse(first.acquire())
+        self.assertTrue(first.lock.acquire(blocking=False))
+        first.lock.release()
+
+
+@replica_reads()
+@cache_page_versioned(60, 'read_from_page', 'group:{slug}')
+def read_from_view(request, slug):
+    return HttpResponse(router.db_for_read(Post))
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class RecentChangeReadsTest(TestCase):
+    """После смены поколения кэшируемое читается из основной базы."""
+    def setUp(self):
+        cache.clear()
+
+    def get(self):
+        request = RequestFactory().get('/group/slug/')
+        return read_from_view(request, slug='slug').content
+
+    def test_page_is_rendered_from_primary_after_change(self):
+        """Страница под новым поколением не берется с отстающей реплики."""
+        self.assertEqual(self.get(), b'replica')
+        bump_generation('group:slug')
+        self.assertEqual(self.get(), b'default')
+        cache.delete('posts:bumped:group:slug')
+        # В кэше осталась страница, прочитанная из основной базы.
+        self.assertEqual(self.get(), b'default')
+        bump_generation('group:slug')
+        cache.delete('posts:bumped:group:slug')
+        self.assertEqual(self.get(), b'replica')
+
+    def test_newest_date_is_read_from_primary_after_change(self):
+        """Дата последнего изменения под новым поколением — из основной."""
+        databases = []
+
+        def newest(request):
+            databases.append(router.db_for_read(Post))
+
+        view = replica_reads()(conditional(lambda request: ['index'], newest)(
+            lambda request: HttpResponse()
+        ))
+        view(RequestFactory().get('/'))
+        bump_generation('index')
+        view(RequestFactory().get('/'))
+        self.assertEqual(databases, ['replica', 'default'])
+
+
+@override_settings(PAGE_CACHE_ADMIT_AFTER=2)
+class PageCacheKeyTest(TestCase):
+    """Варианты адреса одной страницы делят запись кэша."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        for num in range(settings.POSTS_PER_PAGE * 2 + 1):
+            Post.objects.create(author=cls.user, text=f'Пост {num}')
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('posts:index')
+
+    def test_page_variants_share_one_entry(self):
+        """Варианты адреса одной страницы попадают в одну запись."""
+        variants = ['', '?page=1', '?page=01', '?page=abc',
+                    '?page=1&utm_source=crawler', '?sort=new']
+        for query in variants:
+            with self.subTest(query=query):
+                self.client.get(self.url + query)
+        stats = page_cache_stats('index_page')
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], len(variants) - 1)
+
+    def test_deep_page_is_admitted_after_repeated_requests(self):
+        """Дальняя страница попадает в кэш после повторных запросов."""
+        url = self.url + '?page=2'
+        self.client.get(url)
+        self.assertEqual(page_cache_stats('index_page')['rejected'], 1)
+        self.client.get(url + '&utm_source=x')
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertContains(response, f'Пост {settings.POSTS_PER_PAGE}')
+        self.assertEqual(page_cache_stats('index_page')['hits'], 1)
+
+    def test_evicted_page_is_readmitted_at_once(self):
+        """Вытесненная страница допускается в кэш сразу."""
+        self.client.get(self.url)
+        request = RequestFactory().get(self.url + '?page=01')
+        cache.delete(shell_key('index_page', request))
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+        self.assertEqual(page_cache_stats('index_page')['evicted'], 1)
+
+    def test_page_key_follows_paginator(self):
+        """Ключ страницы разбирает номер так же, как paginate."""
+        cases = {
+            '': '', '?page=1': '', '?page= 2': 'page=2', '?page=x': '',
+            '?page=0': 'page=last', '?page=-3': 'page=last',
+            '?page=1.5': '', '?page=3&q=1': 'page=3',
+        }
+        for query, expected in cases.items():
+            with self.subTest(query=query):
+                request = RequestFactory().get(self.url + query)
+                self.assertEqual(page_key(request, cursor=False), expected)
+        request = RequestFactory().get(self.url + '?cursor=garbage')
+        self.assertEqual(page_key(request, cursor=True), '')
+
+
+class FeedRowsTest(TestCase):
+    """Лента строками: обрезанный текст и кэш под поколениями."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(
+            username='auth', first_name='Лев', last_name='Толстой'
+        )
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.long_post = Post.objects.create(
+            author=cls.user, group=cls.group,
+            text='слово ' * settings.FEED_TEXT_LENGTH,
+        )
+        cls.short_post = Post.objects.create(author=cls.user, text='Коротко')
+
+    def setUp(self):
+        cache.clear()
+
+    def rows(self):
+        return FeedRows(Post.objects.feed(), 'index', ['index'])
+
+    def test_rows_read_like_posts(self):
+        """Строки ленты отвечают на те же обращения, что и посты."""
+        short, long = self.rows()[0:2]
+        self.assertIsInstance(short, PostRow)
+        self.assertEqual(short, self.short_post)
+        self.assertEqual(short.excerpt, 'Коротко')
+        self.assertFalse(short.truncated)
+        self.assertIsNone(short.group)
+        self.assertEqual(long.author.username, 'auth')
+        self.assertEqual(long.author.get_full_name(), 'Лев Толстой')
+        self.assertEqual(long.group.slug, 'group')
+        self.assertEqual(long.excerpt, self.long_post.excerpt)
+        self.assertTrue(long.truncated)
+
+    def test_list_pages_show_excerpt_without_loading_text(self):
+        """Ленты показывают начало текста и не читают колонку text."""
+        url = reverse('posts:index')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertNotContains(response, self.long_post.text)
+        self.assertContains(response, self.long_post.excerpt)
+        self.assertContains(response, 'Коротко')
+        detail = reverse('posts:post_detail', args=[self.long_post.pk])
+        self.assertContains(response, f'<a href="{detail}">читать дальше</a>',
+                            count=1, html=True)
+        text_column = '"posts_post"."text"'
+        self.assertFalse(any(
+            text_column in query['sql'] for query in queries.captured_queries
+        ))
+
+    def test_rows_are_cached_until_generation_changes(self):
+        """Строки и их число берутся из кэша до смены поколения."""
+        rows = self.rows()
+        self.assertEqual(len(rows), len(rows[0:2]))
+        with self.assertNumQueries(0):
+            self.assertEqual(len(self.rows()), 2)
+            self.rows()[0:2]
+        Post.objects.create(author=self.user, text='Новый')
+        self.assertEqual(self.rows()[0].excerpt, 'Новый')
+
+    @override_settings(DATABASE_REPLICAS=['replica'])
+    def test_pinned_request_bypasses_row_cache(self):
+        """Закрепленный за основной базой запрос не читает и не пишет кэш."""
+        reset_routing(pinned=True)
+        self.addCleanup(reset_routing)
+        with self.assertNumQueries(2):
+            self.assertEqual(len(self.rows()), 2)
+            self.rows()[0:2]
+        reset_routing()
+        with self.assertNumQueries(2):
+            self.assertEqual(len(self.rows()), 2)
+            self.rows()[0:2]
+
+
+class FeedQueriesTest(TestCase):
+    """Число запросов на страницу ленты не зависит от числа постов."""
+    # COUNT(*) пагинатора и страница постов, плюс группа или автор со
+    # счетчиками и подписка в профиле и дата свежего поста для ETag
+    # (кэшируется до следующей правки). Сессия и пользователь берутся
+    # из кэша.
+    QUERY_BUDGET = {
+        'posts:index': 3,
+        'posts:group_posts': 4,
+        'posts:profile': 5,
+        'posts:follow_index': 2,
+    }
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.author = User.objects.create_user(username='auth')
+        for num in range(settings.POSTS_PER_PAGE):
+            author = User.objects.create_user(username=f'author{num}')
+            Follow.objects.create(user=cls.reader, author=author)
+            post = Post.objects.create(
+                author=author,
+                group=cls.group,
+                text=f'Тестовый пост номер {num}',
+            )
+            Comment.objects.create(post=post, author=cls.reader, text='Да')
+            Post.objects.create(author=cls.author, text=f'Пост {num}')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+
+    def test_feed_pages_fit_query_budget(self):
+        """Страницы ленты укладываются в фиксированное число запросов."""
+        urls = {
+            'posts:index': reverse('posts:index'),
+            'posts:group_posts': reverse('posts:group_posts',
+                                         kwargs={'slug': 'test-slug'}),
+            'posts:profile': reverse('posts:profile',
+                                     kwargs={'username': 'auth'}),
+            'posts:follow_index': reverse('posts:follow_index'),
+        }
+        for name, url in urls.items():
+            with self.subTest(name=name):
+                with self.assertNumQueries(self.QUERY_BUDGET[name]):
+                    response = self.client.get(url)
+                self.assertEqual(len(response.context['page_obj']),
+                                 settings.POSTS_PER_PAGE)
+
+    def test_cached_session_and_user_save_queries(self):
+        """Кэш сессии и пользователя экономит два запроса на страницу."""
+        url = reverse('posts:follow_index')
+        queries = {}
+        for name, engine, backend in (
+            ('db', 'django.contrib.sessions.backends.db',
+             'django.contrib.auth.backends.ModelBackend'),
+            ('cached', settings.SESSION_ENGINE,
+             settings.AUTHENTICATION_BACKENDS[0]),
+        ):
+            with override_settings(SESSION_ENGINE=engine,
+                                   AUTHENTICATION_BACKENDS=[backend]):
+                client = Client()
+                client.force_login(self.reader)
+                client.get(url)
+                with CaptureQueriesContext(connection) as context:
+                    client.get(url)
+                queries[name] = len(context)
+        self.assertEqual(queries['db'] - queries['cached'], 2)
+
+    def test_feed_annotates_comment_count(self):
+        """Посты ленты приходят с числом комментариев."""
+        response = self.client.get(reverse('posts:follow_index'))
+        for post in response.context['page_obj']:
+            self.assertEqual(post.comment_count, 1)
+
+
+@override_settings(COMMENTS_PER_PAGE=3)
+class PostDetailCommentsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(author=cls.user, text='Тестовый пост')
+        cls.other_post = Post.objects.create(author=cls.user, text='Другой')
+        for num in range(5):
+            commenter = User.objects.create_user(username=f'commenter{num}')
+            Comment.objects.create(
+                post=cls.post, author=commenter, text=f'Комментарий {num}'
+            )
+        Comment.objects.create(
+            post=cls.other_post, author=cls.user, text='Чужой комментарий'
+        )
+        cls.url = reverse('posts:post_detail',
+                          kwargs={'post_id': cls.post.pk})
+
+    def setUp(self):
+        cache.clear()
+
+    def test_only_post_comments_are_shown(self):
+        """На странице поста только его комментарии, постранично."""
+        response = self.client.get(self.url)
+        comments = response.context['comments']
+        self.assertEqual(len(comments), 3)
+        self.assertEqual(comments.paginator.count, 5)
+        self.assertTrue(all(c.post_id == self.post.pk for c in comments))
+        self.assertEqual(
+            [c.text for c in comments],
+            ['Комментарий 0', 'Комментарий 1', 'Комментарий 2'],
+        )
+        response = self.client.get(self.url + '?page=2')
+        self.assertEqual(len(response.context['comments']), 2)
+
+    def test_comment_authors_are_joined(self):
+        """Авторы комментариев загружаются вместе с комментариями."""
+        # Автор поста для области кэша (дальше берется из кэша), дата
+        # последнего изменения для ETag, пост с автором, его счетчиками
+        # и группой, COUNT(*) и страница комментариев.
+        with self.assertNumQueries(5):
+            self.client.get(self.url)
+
+    def test_new_post_by_author_updates_post_count(self):
+        """Новый пост автора меняет счетчик и ETag на страницах его постов."""
+        response = self.client.get(self.url)
+        self.assertContains(response, '<span > 2 </span>')
+        Post.objects.create(author=self.user, text='Еще один пост')
+        response = self.client.get(self.url,
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '<span > 3 </span>')
+
+
+@override_settings(FOLLOW_TIMELINE=True, FOLLOW_TIMELINE_LENGTH=3)
+class FollowTimelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.post_author = User.objects.create_user(username='author')
+        cls.follower = User.objects.create_user(username='follow')
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_follower = Client()
+        self.authorized_follower.force_login(self.follower)
+
+    def follow_page(self):
+        response = self.authorized_follower.get(reverse('posts:follow_index'))
+        return list(response.context['page_obj'])
+
+    def test_new_post_is_fanned_out_to_followers(self):
+        """Новый пост попадает в материализованную ленту подписчика."""
+        Follow.objects.create(author=self.post_author, user=self.follower)
+        new_post = Post.objects.create(author=self.post_author, text='Пост')
+        self.assertTrue(
+            TimelineEntry.objects.filter(
+                user=self.follower, post=new_post
+            ).exists()
+        )
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.follow_page(), [new_post])
+        self.assertFalse(any(
+            'posts_follow' in query['sql']
+            for query in queries.captured_queries
+        ))
+
+    def test_follow_backfills_and_unfollow_removes(self):
+        """Подписка дозаполняет ленту, отписка очищает ее."""
+        posts = [
+            Post.objects.create(author=self.post_author, text=f'Пост {num}')
+            for num in range(2)
+        ]
+        self.authorized_follower.get(reverse(
+            'posts:profile_follow', kwargs={'username': 'author'}
+        ))
+        self.assertEqual(self.follow_page(), posts[::-1])
+        self.authorized_follower.get(reverse(
+            'posts:profile_unfollow', kwargs={'username': 'author'}
+        ))
+        self.assertEqual(self.follow_page(), [])
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    def test_timeline_is_trimmed(self):
+        """Лента подписчика не растет дальше FOLLOW_TIMELINE_LENGTH."""
+        Follow.objects.create(author=self.post_author, user=self.follower)
+        posts = [
+            Post.objects.create(author=self.post_author, text=f'Пост {num}')
+            for num in range(5)
+        ]
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.follower).count(), 3
+        )
+        self.assertEqual(self.follow_page(), posts[:1:-1])
+
+    def test_fan_out_queries_do_not_grow_with_followers(self):
+        """Раскладка поста и обрезка лент не зависят от числа подписчиков."""
+        followers = [
+            User.objects.create_user(username=f'reader{num}')
+            for num in range(5)
+        ]
+        for user in followers:
+            Follow.objects.create(author=self.post_author, user=user)
+        for num in range(3):
+            Post.objects.create(author=self.post_author, text=f'Пост {num}')
+        timeline_queries = ('posts_follow', 'posts_timelineentry')
+        with CaptureQueriesContext(connection) as queries:
+            Post.objects.create(author=self.post_author, text='Новый')
+        self.assertEqual(sum(
+            any(table in query['sql'] for table in timeline_queries)
+            for query in queries.captured_queries
+        ), 3)
+        for user in followers:
+            self.assertEqual(
+                TimelineEntry.objects.filter(user=user).count(), 3
+            )
+
+
+class PostCardCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.posts = [
+            Post.objects.create(author=cls.user, text=f'Пост {num}')
+            for num in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def render_index(self):
+        # Сбрасываем кэш страницы, но не карточек.
+        bump_generation('index')
+        return self.client.get(reverse('posts:index'))
+
+    def test_cards_are_reused_between_pages(self):
+        """Повторная отрисовка ленты берет карточки из кэша."""
+        first = self.render_index().content
+        self.assertEqual(card_cache_stats('posts:index'),
+                         {'hits': 0, 'misses': 3})
+        second = self.render_index().content
+        self.assertEqual(card_cache_stats('posts:index'),
+                         {'hits': 3, 'misses': 3})
+        self.assertEqual(first, second)
+
+    def test_edited_post_card_is_rendered_again(self):
+        """Правка поста меняет версию его карточки."""
+        self.render_index()
+        post = self.posts[0]
+        post.text = 'Измененный пост'
+        post.save()
+        response = self.render_index()
+        self.assertContains(response, 'Измененный пост')
+        self.assertEqual(card_cache_stats('posts:index'),
+                         {'hits': 2, 'misses': 4})
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.post_author = Client()
+        self.post_author.force_login(self.user)
+
+    def create_post(self):
+        uploaded = SimpleUploadedFile(
+            name='small.gif',
+            content=SMALL_GIF,
+            content_type='image/gif'
+        )
+        self.post_author.post(
+            reverse('posts:post_create'),
+            data={'text': 'Пост с картинкой', 'image': uploaded},
+        )
+        return Post.objects.get(text='Пост с картинкой')
+
+    def test_placeholder_until_thumbnail_is_ready(self):
+        """Пока миниатюра готовится в фоне, страница показывает заглушку."""
+        post = self.create_post()
+        self.assertIsNone(thumbnails.ready_url(post.image.name))
+        response = self.post_author.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        )
+        self.assertContains(response, 'bg-light')
+        self.assertNotContains(response, '<img class="card-img')
+
+    @override_settings(THUMBNAIL_ASYNC=False)
+    def test_thumbnail_is_generated_after_create(self):
+        """После создания поста миниатюра готова и выводится на страницах."""
+        post = self.create_post()
+        url = thumbnails.ready_url(post.image.name)
+        self.assertIsNotNone(url)
+        for reverse_name in [
+            reverse('posts:index'),
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}),
+        ]:
+            with self.subTest(reverse_name=reverse_name):
+                response = self.post_author.get(reverse_name)
+                self.assertContains(response, url)
+
+    @override_settings(THUMBNAIL_ASYNC=False)
+    def test_legacy_thumbnail_refreshes_cached_pages(self):
+        """Миниатюра старой картинки, готовая позже, сбрасывает кэш
+        страниц с постом."""
+        name = default_storage.save('posts/legacy.gif',
+                                    ContentFile(SMALL_GIF))
+        post = Post.objects.create(author=self.user, text='Старый пост',
+                                   image=name)
+        generation = get_generation(f'post:{post.pk}')
+        self.client.get(reverse('posts:index'))
+        url = thumbnails.ready_url(name)
+        self.assertIsNotNone(url)
+        self.assertNotEqual(get_generation(f'post:{post.pk}'), generation)
+        self.assertContains(self.client.get(reverse('posts:index')), url)
+
+
+class SearchViewMixin:
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.twice = Post.objects.create(
+            author=cls.user, text='Кот и кот встретили собаку'
+        )
+        cls.once = Post.objects.create(
+            author=cls.user, text='Кот и мышь встретили собаку'
+        )
+        Post.objects.bulk_create(
+            Post(author=cls.user, text=f'Слон номер {num}')
+            for num in range(settings.POSTS_PER_PAGE + 1)
+        )
+        search.get_backend().rebuild()
+
+    def search(self, query, page=None):
+        data = {'q': query}
+        if page:
+            data['page'] = page
+        return self.client.get(reverse('posts:search'), data)
+
+    def test_results_are_ranked(self):
+        """Пост, где слово встречается чаще, выше в выдаче."""
+        response = self.search('КОТ')
+        self.assertEqual(
+            list(response.context['page_obj']), [self.twice, self.once]
+        )
+
+    def test_all_words_are_required(self):
+        """Находятся только посты со всеми словами запроса."""
+        response = self.search('кот мышь')
+        self.assertEqual(list(response.context['page_obj']), [self.once])
+
+    def test_index_follows_edit_and_delete(self):
+        """Индекс обновляется при правке и удалении поста."""
+        post = Post.objects.get(pk=self.once.pk)
+        post.text = 'Ёж встретил собаку'
+        post.save()
+        self.assertEqual(
+            list(self.search('мышь').context['page_obj']), []
+        )
+        self.assertEqual(
+            list(self.search('ёж').context['page_obj']), [self.once]
+        )
+        Post.objects.filter(pk=self.twice.pk).delete()
+        self.assertEqual(
+            list(self.search('собаку').context['page_obj']), [self.once]
+        )
+
+    def test_results_are_paginated(self):
+        """Выдача делится на страницы, запрос сохраняется в ссылках."""
+        response = self.search('слон')
+        self.assertEqual(response.context['paginator'].count,
+                         settings.POSTS_PER_PAGE + 1)
+        self.assertContains(response, '?q=%D1%81%D0%BB%D0%BE%D0%BD&amp;page=2')
+        response = self.search('слон', page=2)
+        self.assertEqual(len(response.context['page_obj']), 1)
+
+    def test_empty_query(self):
+        """Пустой запрос дает пустую выдачу, а не ошибку."""
+        response = self.search('')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['paginator'].count, 0)
+
+
+@override_settings(SEARCH_BACKEND='fts5')
+class FtsSearchViewTest(SearchViewMixin, TestCase):
+    @override_settings(DATABASE_REPLICAS=['replica'])
+    def test_search_reads_replica(self):
+        """Под replica_reads() запросы FTS5 идут в реплику."""
+        with mock.patch('posts.search.connections') as connections:
+            with replica_reads():
+                search.FtsBackend().count(['кот'])
+        connections.__getitem__.assert_called_once_with('replica')
+
+
+@override_settings(SEARCH_BACKEND='index')
+class InvertedIndexSearchViewTest(SearchViewMixin, TestCase):
+    pass
+
+
+class ExportTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.staff = User.objects.create_user(username='staff', is_staff=True)
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.user, group=cls.group, text='Пост в группе'
+        )
+        Post.objects.create(author=cls.staff, text='Пост без группы')
+        Comment.objects.create(post=cls.post, author=cls.staff, text='Да')
+
+    def export(self, **params):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('posts:export_posts'), params)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_export_is_for_staff_only(self):
+        """Выгрузка доступна только сотрудникам."""
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('posts:export_posts'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_ndjson_export(self):
+        """По умолчанию посты выгружаются в NDJSON с комментариями."""
+        lines = self.export().splitlines()
+        self.assertEqual(len(lines), 2)
+        record = json.loads(lines[0])
+        self.assertEqual(record['author'], 'auth')
+        self.assertEqual(record['group'], 'test-slug')
+        self.assertEqual(record['comments'][0]['text'], 'Да')
+
+    def test_csv_export_with_filter(self):
+        """CSV-выгрузка учитывает фильтр по автору."""
+        rows = list(csv.DictReader(io.StringIO(
+            self.export(format='csv', author='auth')
+        )))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['text'], 'Пост в группе')
+        self.assertEqual(json.loads(rows[0]['comments'])[0]['author'],
+                         'staff')
+
+    def test_export_command_reads_posts_in_chunks(self):
+        """Команда читает посты курсором и комментарии пачками."""
+        out = io.StringIO()
+        # Один курсор по постам и по запросу комментариев на пачку.
+        with self.assertNumQueries(3):
+            call_command('export_posts', chunk_size=1, stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 2)
@@ -0,0 +1,91 @@
+"""Фоновая подготовка миниатюр картинок постов.
+
+Миниатюры генерируются пулом потоков после сохранения поста, а шаблоны
+показывают их только когда они готовы: до этого вместо картинки выводится
+заглушка, и запрос не платит за декодирование и масштабирование в Pillow.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from sorl.thumbnail import get_thumbnail
+
+from .caching import bump_post_pages
+
+logger = logging.getLogger(__name__)
+
+GEOMETRY = '960x339'
+OPTIONS = {'crop': 'center', 'upscale': True}
+READY_KEY = 'thumbnail:{}:{}'
+PENDING_TIMEOUT = 60
+
+_executor = None
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            thread_name_prefix='thumbnails',
+        )
+    return _executor
+
+
+def ready_key(name):
+    return READY_KEY.format(GEOMETRY, name)
+
+
+def ready_url(name):
+    """URL готовой миниатюры или None, если она еще не сгенерирована."""
+    return cache.get(ready_key(name))
+
+
+def generate(name, post_id=None):
+    """Генерирует миниатюру и сбрасывает кэш страниц, где виден пост."""
+    thumbnail = get_thumbnail(name, GEOMETRY, **OPTIONS)
+    cache.set(ready_key(name), thumbnail.url, None)
+    if post_id is not None:
+        bump_post_pages(post_id)
+    return thumbnail.url
+
+
+def generate_safely(name, post_id=None):
+    """Как generate, но для рабочих потоков: ошибки пишутся в лог."""
+    close_old_connections()
+    try:
+        generate(name, post_id)
+    except Exception:
+        logger.exception('Не удалось сгенерировать миниатюру %s', name)
+        return False
+    finally:
+        close_old_connections()
+    return True
+
+
+def schedule(name, post_id=None):
+    """Ставит генерацию миниатюры в очередь после коммита транзакции."""
+    if not name:
+        return
+    if not settings.THUMBNAIL_ASYNC:
+        generate(name, post_id)
+        return
+    transaction.on_commit(
+        lambda: executor().submit(generate_safely, name, post_id)
+    )
+
+
+def ensure(name, post_id=None):
+    """Готовая миниатюра или None; отсутствующую ставит в очередь один раз.
+
+    post_id — пост с картинкой: когда миниатюра будет готова, страницы
+    с ним перестанут показывать заглушку.
+    """
+    url = ready_url(name)
+    if url is None and cache.add(ready_key(name) + ':pending', True,
+                                 PENDING_TIMEOUT):
+        schedule(name, post_id)
+        url = ready_url(name)
+    return url
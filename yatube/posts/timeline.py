@@ -0,0 +1,95 @@
+"""Материализованная лента подписок (fan-out on write).
+
+Новый пост раскладывается подписчикам автора в TimelineEntry, поэтому
+follow_index читает одну ленту по индексу (user, -pub_date) вместо
+соединения Follow и Post по всем авторам.
+"""
+from django.conf import settings
+from django.db.models import F, OuterRef, Q, Subquery
+
+from .models import Follow, Post, TimelineEntry
+
+
+def enabled():
+    return settings.FOLLOW_TIMELINE
+
+
+def feed(user):
+    """Посты авторов, на которых подписан user, для ленты подписок."""
+    if enabled():
+        return Post.objects.feed().filter(
+            timeline_entries__user=user
+        ).order_by('-timeline_entries__pub_date')
+    return Post.objects.feed().filter(author__following__user=user)
+
+
+def trim(user_ids):
+    """Оставляет в лентах пользователей не больше FOLLOW_TIMELINE_LENGTH.
+
+    Один DELETE на всех: для каждой ленты подзапрос находит первую
+    лишнюю запись, и удаляется она и все, что старше.
+    """
+    length = settings.FOLLOW_TIMELINE_LENGTH
+    first_stale = TimelineEntry.objects.filter(
+        user_id=OuterRef('user_id')
+    ).order_by('-pub_date', '-pk')[length:length + 1]
+    TimelineEntry.objects.filter(user_id__in=user_ids).annotate(
+        stale_date=Subquery(first_stale.values('pub_date')),
+        stale_pk=Subquery(first_stale.values('pk')),
+    ).filter(
+        Q(pub_date__lt=F('stale_date'))
+        | Q(pub_date=F('stale_date'), pk__lte=F('stale_pk'))
+    ).delete()
+
+
+def fan_out(post):
+    follower_ids = list(
+        Follow.objects.filter(
+            author_id=post.author_id
+        ).values_list('user_id', flat=True)
+    )
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(
+                user_id=user_id,
+                post=post,
+                author_id=post.author_id,
+                pub_date=post.pub_date,
+            )
+            for user_id in follower_ids
+        ],
+        ignore_conflicts=True,
+    )
+    trim(follower_ids)
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту последние посты автора, на которого подписались."""
+    posts = Post.objects.filter(author_id=author_id).order_by(
+        '-pub_date'
+    ).values_list('pk', 'pub_date')[:settings.FOLLOW_TIMELINE_LENGTH]
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(
+                user_id=user_id,
+                post_id=post_id,
+                author_id=author_id,
+                pub_date=pub_date,
+            )
+            for post_id, pub_date in posts
+        ],
+        ignore_conflicts=True,
+    )
+    trim([user_id])
+
+
+def remove(user_id, author_id):
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def rebuild():
+    """Заполняет ленты заново по текущим подпискам."""
+    TimelineEntry.objects.all().delete()
+    follows = Follow.objects.order_by().values_list('user_id', 'author_id')
+    for user_id, author_id in follows.iterator():
+        backfill(user_id, author_id)
@@ -1,13 +1,192 @@
+import base64
+import binascii
+
 from django.core.paginator import Paginator
 from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+CURSOR_AFTER = 'n'
+CURSOR_BEFORE = 'p'
+
+
+class CursorPage:
+    """Страница курсорной пагинации.
+
+    В отличие от Page не знает ни своего номера, ни общего числа страниц,
+    зато умеет отдавать курсоры на соседние страницы.
+    """
+    is_cursor = True
+
+    def __init__(self, object_list, paginator,
+                 next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return '<Cursor page of %s objects>' % len(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
 
 
-def paginate(queryset, request):
-    paginator = Paginator(queryset, settings.POSTS_PER_PAGE)
-    page_number = request.GET.get('page')
+class CursorPaginator:
+    """Пагинация по ключу (дата, id) без COUNT(*) и OFFSET.
+
+    Любая страница выбирается одним запросом по индексу, поэтому
+    глубокие страницы ленты стоят столько же, сколько первая.
+    """
+
+    def __init__(self, object_list, per_page, date_field='pub_date'):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.date_field = date_field
+
+    def encode_cursor(self, direction, obj):
+        value = getattr(obj, self.date_field).isoformat()
+        raw = f'{direction}|{value}|{obj.pk}'.encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """Возвращает (направление, дата, id) или None для битого курсора."""
+        if not cursor:
+            return None
+        try:
+            padding = '=' * (-len(cursor) % 4)
+            raw = base64.urlsafe_b64decode(cursor + padding).decode()
+            direction, value, pk = raw.split('|')
+            date = parse_datetime(value)
+            pk = int(pk)
+        except (ValueError, binascii.Error, UnicodeDecodeError):
+            return None
+        if direction not in (CURSOR_AFTER, CURSOR_BEFORE) or date is None:
+            return None
+        return direction, date, pk
+
+    def _fetch(self, queryset):
+        rows = list(queryset[:self.per_page + 1])
+        return rows[:self.per_page], len(rows) > self.per_page
+
+    def get_page(self, cursor):
+        field = self.date_field
+        position = self.decode_cursor(cursor)
+        if position is not None:
+            direction, date, pk = position
+            if direction == CURSOR_BEFORE:
+                newer = self.object_list.filter(
+                    Q(**{f'{field}__gt': date})
+                    | Q(**{field: date, 'pk__gt': pk})
+                ).order_by(field, 'pk')
+                rows, has_more = self._fetch(newer)
+                if rows:
+                    rows.reverse()
+                    return CursorPage(
+                        rows,
+                        self,
+                        next_cursor=self.encode_cursor(CURSOR_AFTER, rows[-1]),
+                        previous_cursor=(
+                            self.encode_cursor(CURSOR_BEFORE, rows[0])
+                            if has_more else None
+                        ),
+                    )
+                # Новее курсора ничего нет: показываем первую страницу.
+            else:
+                older = self.object_list.filter(
+                    Q(**{f'{field}__lt': date})
+                    | Q(**{field: date, 'pk__lt': pk})
+                ).order_by(f'-{field}', '-pk')
+                rows, has_more = self._fetch(older)
+                return CursorPage(
+                    rows,
+                    self,
+                    next_cursor=(
+                        self.encode_cursor(CURSOR_AFTER, rows[-1])
+                        if has_more else None
+                    ),
+                    previous_cursor=(
+                        self.encode_cursor(CURSOR_BEFORE, rows[0])
+                        if rows else None
+                    ),
+                )
+        rows, has_more = self._fetch(
+            self.object_list.order_by(f'-{field}', '-pk')
+        )
+        return CursorPage(
+            rows,
+            self,
+            next_cursor=(
+                self.encode_cursor(CURSOR_AFTER, rows[-1])
+                if has_more else None
+            ),
+        )
+
+
+def use_cursor(request):
+    """Включена ли курсорная пагинация для текущего view в настройках."""
+    match = getattr(request, 'resolver_match', None)
+    return (
+        match is not None
+        and match.view_name in settings.CURSOR_PAGINATION_VIEWS
+    )
+
+
+def paginate(queryset, request, cursor=None, per_page=None):
+    if cursor is None:
+        cursor = use_cursor(request)
+    if per_page is None:
+        per_page = settings.POSTS_PER_PAGE
+    if cursor:
+        # Курсорам нужен сам QuerySet, а не строки ленты (posts.feed).
+        queryset = getattr(queryset, 'queryset', queryset)
+        paginator = CursorPaginator(queryset, per_page)
+        page_number = request.GET.get('cursor')
+    else:
+        paginator = Paginator(queryset, per_page)
+        page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     return {
         'paginator': paginator,
         'page_number': page_number,
         'page_obj': page_obj,
     }
+
+
+def page_key(request, cursor=None):
+    """Параметр страницы так, как его поймет paginate, для ключа кэша.
+
+    Пустая строка — первая страница. Номера вроде '01' и ' 1' сводятся
+    к одному, нечисловые — к первой странице, меньше единицы — к
+    последней (так их показывает Paginator.get_page), битый курсор — к
+    первой странице. Остальные параметры запроса страницу не меняют.
+    """
+    if cursor is None:
+        cursor = use_cursor(request)
+    if cursor:
+        value = request.GET.get('cursor')
+        if CursorPaginator(None, 1).decode_cursor(value) is None:
+            return ''
+        return f'cursor={value}'
+    try:
+        number = int(request.GET.get('page'))
+    except (TypeError, ValueError):
+        return ''
+    if number < 1:
+        return 'page=last'
+    return f'page={number}' if number > 1 else ''
@@ -1,21 +1,55 @@
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.cache import cache_page
-from .models import Post, Group, User, Comment, Follow
+from core.db import replica_reads
+from .models import Post, Group, User, Follow
+from . import export, thumbnails, timeline
+from .caching import (
+    cache_page_versioned, conditional, newest_pub_date, post_author_scope,
+    post_modified,
+)
+from .feed import FeedRows
 from .forms import PostForm, CommentForm
+from .images import limit_upload_size
+from .search import SearchResults
 from .utils import paginate
 
 
-@cache_page(20, key_prefix="index_page")
+@replica_reads()
+@conditional(
+    lambda request: ['index'],
+    lambda request: newest_pub_date(Post.objects.all()),
+    per_user=True,
+    last_modified=False,
+)
+@cache_page_versioned(settings.PAGE_CACHE_TIMEOUT, 'index_page', 'index')
 def index(request):
-    post_list = Post.objects.all()
+    post_list = FeedRows(Post.objects.feed(), 'index', ['index'])
     context = paginate(post_list, request)
     return render(request, 'posts/index.html', context)
 
 
+@replica_reads()
+@conditional(
+    lambda request, slug: [f'group:{slug}'],
+    lambda request, slug: newest_pub_date(
+        Post.objects.filter(group__slug=slug)
+    ),
+    per_user=True,
+    last_modified=False,
+)
+@cache_page_versioned(
+    settings.PAGE_CACHE_TIMEOUT, 'group_page', 'group:{slug}'
+)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all()
+    post_list = FeedRows(
+        group.posts.feed(), f'group:{slug}', [f'group:{slug}']
+    )
     context = {
         'group': group,
     }
@@ -23,49 +57,77 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@replica_reads()
+@conditional(
+    # Подписка и отписка увеличивают поколение профиля автора, так что
+    # кнопка подписки в ETag учтена.
+    lambda request, username: [f'profile:{username}'],
+    lambda request, username: newest_pub_date(
+        Post.objects.filter(author__username=username)
+    ),
+    per_user=True,
+    last_modified=False,
+)
+@cache_page_versioned(
+    settings.PAGE_CACHE_TIMEOUT, 'profile_page', 'profile:{username}'
+)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    post_list = author.posts.all()
-    following = False
-    if request.user.is_authenticated:
-        author = get_object_or_404(User, username=username)
-        follow = Follow.objects.filter(
-            user=request.user,
-            author=author)
-        if follow.exists():
-            following = True
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username
+    )
+    post_list = FeedRows(
+        author.posts.feed(), f'profile:{username}', [f'profile:{username}']
+    )
     context = {
         'author': author,
-        'following': following,
     }
     context.update(paginate(post_list, request))
     return render(request, 'posts/profile.html', context)
 
 
+@replica_reads()
+@conditional(
+    # Число постов автора на странице меняется с его профилем.
+    lambda request, post_id: [f'post:{post_id}', post_author_scope(post_id)],
+    post_modified,
+    per_user=True,
+    last_modified=False,
+)
+@cache_page_versioned(
+    settings.PAGE_CACHE_TIMEOUT, 'post_page', 'post:{post_id}',
+    post_author_scope,
+    # Постов много, и каждый по отдельности читают редко.
+    cursor=False, admit_first_page=False,
+)
 def post_detail(request, post_id):
-    post_open = get_object_or_404(Post, id=post_id)
-    comments = Comment.objects.select_related('post')
-    form = CommentForm(
-        request.POST or None,
+    post_open = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), id=post_id
     )
+    comment_list = post_open.comments.select_related('author')
     context = {
         'post_open': post_open,
-        'comments': comments,
-        'form': form,
     }
+    context.update(paginate(
+        comment_list, request,
+        cursor=False, per_page=settings.COMMENTS_PER_PAGE
+    ))
+    context['comments'] = context['page_obj']
     return render(request, 'posts/post_detail.html', context)
 
 
+@limit_upload_size
 @login_required
 def post_create(request):
     form = PostForm(
         request.POST or None,
-        files=request.FILES or None
+        files=request.FILES or None,
+        rejected_files=getattr(request, 'rejected_uploads', ()),
     )
     if form.is_valid():
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        thumbnails.schedule(post.image.name, post.pk)
         return redirect('posts:profile', username=request.user)
     context = {
         'form': form,
@@ -73,6 +135,7 @@ def post_create(request):
     return render(request, 'posts/create_post.html', context)
 
 
+@limit_upload_size
 @login_required
 def post_edit(request, post_id):
     is_edit = True
@@ -83,10 +146,12 @@ def post_edit(request, post_id):
         form = PostForm(
             request.POST or None,
             files=request.FILES or None,
-            instance=post
+            instance=post,
+            rejected_files=getattr(request, 'rejected_uploads', ()),
         )
         if form.is_valid():
-            form.save()
+            post = form.save()
+            thumbnails.schedule(post.image.name, post.pk)
             return redirect('posts:post_detail', post_id=post_id)
         context = {
             'form': form,
@@ -109,12 +174,30 @@ def add_comment(request, post_id):
 
 
 @login_required
+@replica_reads()
 def follow_index(request):
-    post_list = Post.objects.filter(author__following__user=request.user)
+    # Лента подписок меняется вместе с любым постом ('index') и с
+    # подписками пользователя (они сбрасывают его профиль).
+    post_list = FeedRows(
+        timeline.feed(request.user),
+        f'follow:{request.user.pk}',
+        ['index', f'profile:{request.user.username}'],
+    )
     context = paginate(post_list, request)
     return render(request, 'posts/follow.html', context)
 
 
+@replica_reads()
+def search(request):
+    query = request.GET.get('q', '').strip()
+    context = {
+        'query': query,
+        'page_query': urlencode({'q': query}) + '&',
+    }
+    context.update(paginate(SearchResults(query), request, cursor=False))
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
@@ -134,3 +217,23 @@ def profile_unfollow(request, username):
     )
     follower.delete()
     return redirect('posts:profile', username=username)
+
+
+@staff_member_required
+def export_posts(request):
+    """Выгрузка постов с комментариями потоком, без сборки в памяти."""
+    export_format = request.GET.get('format')
+    if export_format not in export.FORMATS:
+        export_format = 'ndjson'
+    content_type, extension = export.FORMATS[export_format]
+    posts = export.posts_for(
+        author=request.GET.get('author'), group=request.GET.get('group')
+    )
+    response = StreamingHttpResponse(
+        export.lines(export_format, posts),
+        content_type=f'{content_type}; charset=utf-8',
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="posts.{extension}"'
+    )
+    return response
@@ -0,0 +1,84 @@
+"""Бэкенд аутентификации, который берет пользователя из кэша.
+
+AuthenticationMiddleware на каждом запросе загружает пользователя из
+сессии отдельным запросом к базе. CachedModelBackend хранит значения
+полей пользователя в кэше USER_CACHE_TIMEOUT секунд; сохранение
+пользователя (в том числе last_login при входе) обновляет запись,
+удаление — стирает. Массовые update() сигналов не шлют, поэтому после
+них нужно вызвать forget_cached_users.
+
+Хэш пароля в кэш не попадает: вместо него хранится хэш сессии (HMAC от
+пароля), которым Django проверяет сессию. Смена пароля по-прежнему
+разлогинивает другие сессии, а сам пароль, если он понадобится, например
+для check_password, дочитывается из базы.
+"""
+from functools import partial
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.base_user import AbstractBaseUser
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+User = get_user_model()
+USER_KEY = 'users:user:{}'
+CACHED_FIELDS = [
+    field.attname for field in User._meta.concrete_fields
+    if field.attname != 'password'
+]
+
+
+def cache_user(user):
+    values = [getattr(user, field) for field in CACHED_FIELDS]
+    values.append(AbstractBaseUser.get_session_auth_hash(user))
+    cache.set(USER_KEY.format(user.pk), values, settings.USER_CACHE_TIMEOUT)
+
+
+def session_auth_hash(user, cached_hash):
+    # После set_password пароль уже не отложен: хэш считается заново.
+    if 'password' in user.get_deferred_fields():
+        return cached_hash
+    return AbstractBaseUser.get_session_auth_hash(user)
+
+
+def cached_user(user_id):
+    values = cache.get(USER_KEY.format(user_id))
+    if values is None:
+        return None
+    *values, cached_hash = values
+    # Свежий экземпляр без закэшированных связанных объектов и пароля.
+    user = User.from_db('default', CACHED_FIELDS, values)
+    user.get_session_auth_hash = partial(session_auth_hash, user, cached_hash)
+    return user
+
+
+def forget_cached_users(user_ids):
+    """Стирает из кэша пользователей, измененных в обход save()."""
+    cache.delete_many([USER_KEY.format(user_id) for user_id in user_ids])
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        user = cached_user(user_id)
+        if user is None:
+            try:
+                user = User._default_manager.get(pk=user_id)
+            except User.DoesNotExist:
+                return None
+            cache_user(user)
+        return user if self.user_can_authenticate(user) else None
+
+
+@receiver(post_save, sender=User)
+def refresh_cached_user(sender, instance, **kwargs):
+    if instance.get_deferred_fields():
+        cache.delete(USER_KEY.format(instance.pk))
+    else:
+        cache_user(instance)
+
+
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    cache.delete(USER_KEY.format(instance.pk))
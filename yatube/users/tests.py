@@ -0,0 +1,85 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from .backends import USER_KEY, CachedModelBackend, forget_cached_users
+
+User = get_user_model()
+
+
+class CachedModelBackendTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='auth', password='old-password-123'
+        )
+        self.backend = CachedModelBackend()
+
+    def test_user_is_loaded_without_queries(self):
+        """Пользователь сессии берется из кэша без запросов к базе."""
+        with self.assertNumQueries(0):
+            user = self.backend.get_user(self.user.pk)
+        self.assertEqual(user, self.user)
+        self.assertFalse(user._state.adding)
+
+    def test_cache_is_refreshed_on_save_and_delete(self):
+        """Сохранение обновляет кэш пользователя, удаление стирает."""
+        cache.clear()
+        with self.assertNumQueries(1):
+            self.backend.get_user(self.user.pk)
+        self.user.first_name = 'Имя'
+        self.user.save()
+        self.assertEqual(self.backend.get_user(self.user.pk).first_name, 'Имя')
+        self.user.delete()
+        self.assertIsNone(self.backend.get_user(self.user.pk))
+
+    def test_inactive_user_is_rejected(self):
+        """Неактивный пользователь из кэша не аутентифицируется."""
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(self.backend.get_user(self.user.pk))
+
+    @override_settings(
+        SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies'
+    )
+    def test_password_change_logs_out_other_sessions(self):
+        """Смена пароля разлогинивает сессии со старым хэшем."""
+        self.client.force_login(self.user)
+        url = reverse('posts:follow_index')
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.user.set_password('new-password-456')
+        self.user.save()
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+    def test_password_hash_is_not_cached(self):
+        """Хэш пароля не хранится в кэше и дочитывается из базы."""
+        self.backend.get_user(self.user.pk)
+        self.assertNotIn(self.user.password, cache.get(USER_KEY.format(
+            self.user.pk
+        )))
+        user = self.backend.get_user(self.user.pk)
+        with self.assertNumQueries(1):
+            self.assertTrue(user.check_password('old-password-123'))
+
+    def test_bulk_update_is_applied_after_forgetting(self):
+        """Массовый update() виден после forget_cached_users."""
+        self.backend.get_user(self.user.pk)
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        forget_cached_users([self.user.pk])
+        self.assertIsNone(self.backend.get_user(self.user.pk))
+
+    def test_password_change_keeps_current_session(self):
+        """Смена пароля через форму оставляет в системе только эту сессию."""
+        url = reverse('posts:follow_index')
+        other = self.client_class()
+        for client in (self.client, other):
+            client.force_login(self.user)
+            self.assertEqual(client.get(url).status_code, 200)
+        self.client.post(reverse('users:password_change'), {
+            'old_password': 'old-password-123',
+            'new_password1': 'new-password-456',
+            'new_password2': 'new-password-456',
+        })
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(other.get(url).status_code, 302)
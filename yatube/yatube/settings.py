@@ -7,11 +7,46 @@ SECRET_KEY = os.getenv('MY_KEY', 'randompassword')
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 
+# Кэш процесса (locmem) или общий для всех воркеров: file или memcached.
+# CACHE_LOCATION задает каталог файлового кэша или адрес memcached.
+CACHE_BACKENDS = {
+    'locmem': (
+        'django.core.cache.backends.locmem.LocMemCache',
+        '',
+    ),
+    'file': (
+        'django.core.cache.backends.filebased.FileBasedCache',
+        os.path.join(BASE_DIR, 'cache'),
+    ),
+    'memcached': (
+        'django.core.cache.backends.memcached.MemcachedCache',
+        '127.0.0.1:11211',
+    ),
+}
+CACHE_BACKEND, CACHE_LOCATION = CACHE_BACKENDS[
+    os.getenv('CACHE_BACKEND', 'locmem')
+]
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv('CACHE_LOCATION', CACHE_LOCATION),
     }
 }
+# Сколько живут кэшированные страницы лент; устаревание по изменениям
+# обеспечивают поколения в posts.caching.
+PAGE_CACHE_TIMEOUT = 60 * 5
+# После мягкого TTL или смены поколения страницу перестраивает один
+# запрос, а остальные до жесткого TTL получают прежнюю версию. Чужой
+# блокировки без прежней версии ждут до PAGE_CACHE_LOCK_WAIT секунд.
+PAGE_CACHE_HARD_TIMEOUT = 60 * 60
+PAGE_CACHE_LOCK_TIMEOUT = 10
+PAGE_CACHE_LOCK_WAIT = 2
+# Кроме первых страниц лент, в кэш попадают только страницы, запрошенные
+# PAGE_CACHE_ADMIT_AFTER раз за PAGE_CACHE_ADMIT_WINDOW секунд.
+PAGE_CACHE_ADMIT_AFTER = 2
+PAGE_CACHE_ADMIT_WINDOW = 60 * 10
+# Отрисованные карточки постов; ключ включает версию содержимого.
+POST_CARD_CACHE_TIMEOUT = 60 * 60
 
 DEBUG = True
 
@@ -39,10 +74,12 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.ReplicaPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -70,12 +107,75 @@ TEMPLATES = [
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+# База: DB_ENGINE=sqlite (по умолчанию) или postgresql (нужен psycopg2).
+# Соединения живут DB_CONN_MAX_AGE секунд и переиспользуются запросами,
+# а не открываются заново на каждый.
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite')
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', 60))
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DB_NAME', 'yatube'),
+            'USER': os.getenv('DB_USER', 'yatube'),
+            'PASSWORD': os.getenv('DB_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', 'localhost'),
+            'PORT': os.getenv('DB_PORT', '5432'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'OPTIONS': {'connect_timeout': 5},
+        }
     }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('DB_NAME', os.path.join(BASE_DIR, 'db.sqlite3')),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            # Секунды ожидания снятия блокировки: драйвер sqlite3
+            # выставляет по ним PRAGMA busy_timeout.
+            'OPTIONS': {'timeout': 5},
+        }
+    }
+# Реплики только для чтения для лент (core.db): в DB_REPLICAS через
+# запятую файлы SQLite или хосты PostgreSQL, настройки остальные как у
+# основной базы. Записавший браузер REPLICA_PIN_SECONDS читает только из
+# основной, чтобы сразу видеть свои изменения.
+DATABASE_REPLICAS = []
+for num, location in enumerate(
+    filter(None, os.getenv('DB_REPLICAS', '').split(',')), 1
+):
+    alias = f'replica{num}'
+    DATABASES[alias] = dict(DATABASES['default'], TEST={'MIRROR': 'default'})
+    DATABASES[alias]['HOST' if DB_ENGINE == 'postgresql' else 'NAME'] = (
+        location.strip()
+    )
+    DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ['core.db.ReplicaRouter']
+REPLICA_PIN_COOKIE = 'pin_primary'
+REPLICA_PIN_SECONDS = 10
+# Проверять постоянные соединения перед первым обращением в запросе
+# (core.db).
+DATABASE_HEALTH_CHECKS = True
+# PRAGMA для каждого нового соединения SQLite (core.db); busy_timeout
+# задается через OPTIONS['timeout'].
+SQLITE_PRAGMAS = {
+    'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': 'NORMAL',
+}
+
+# Сессии: 'db' — только база, 'cached_db' — кэш с записью в базу,
+# 'signed_cookies' — подписанные куки без хранилища на сервере (сессию
+# нельзя отозвать, пока не сменится SECRET_KEY).
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
 }
+SESSION_ENGINE = SESSION_ENGINES[os.getenv('SESSION_BACKEND', 'cached_db')]
+# Пользователь сессии берется из кэша (users.backends). Срок короткий:
+# массовый update() без forget_cached_users виден не позже чем через него.
+AUTHENTICATION_BACKENDS = ['users.backends.CachedModelBackend']
+USER_CACHE_TIMEOUT = 5 * 60
 
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -121,3 +221,38 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
 EMPTY_VALUE = '-пусто-'
 POSTS_PER_PAGE = 10
+# Сколько символов текста поста показывает карточка в лентах: длина
+# Post.excerpt. После изменения нужна команда backfill_excerpts.
+FEED_TEXT_LENGTH = 500
+COMMENTS_PER_PAGE = 20
+# Имена view, для которых вместо нумерованных страниц используются курсоры
+# (например, 'posts:index'); курсоры не требуют COUNT(*) и OFFSET.
+CURSOR_PAGINATION_VIEWS = ()
+# Лента подписок, материализованная при публикации поста (posts.timeline).
+FOLLOW_TIMELINE = False
+FOLLOW_TIMELINE_LENGTH = 500
+# Миниатюры картинок постов готовятся пулом потоков после сохранения
+# (posts.thumbnails); при False — синхронно, как в тестах.
+THUMBNAIL_ASYNC = True
+THUMBNAIL_WORKERS = 2
+# Загрузка картинок постов (posts.images): лимит размера проверяется
+# во время приема файла в post_create и post_edit, оригинал уменьшается
+# и перекодируется.
+POST_IMAGE_MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+POST_IMAGE_MAX_DIMENSIONS = (1920, 1920)
+# 'JPEG' (прогрессивный) или 'WEBP', если Pillow собран с его поддержкой.
+POST_IMAGE_FORMAT = 'JPEG'
+POST_IMAGE_QUALITY = 82
+# Полнотекстовый поиск (posts.search): 'fts5' — таблица SQLite FTS5,
+# 'index' — обратный индекс в таблице SearchTerm, 'auto' — FTS5,
+# если таблица создана миграцией. После смены — rebuild_search_index.
+SEARCH_BACKEND = 'auto'
+# Профилирование запросов (core.middleware): Server-Timing со временем
+# SQL, шаблонов и миниатюр. PROFILING включает его для всех запросов,
+# заголовок PROFILING_HEADER — для одного запроса сотрудника.
+PROFILING = False
+PROFILING_HEADER = 'X-Profile'
+# Каталог для файлов cProfile и доля профилируемых запросов, которые
+# в него сохраняются; None — не сохранять.
+PROFILING_CPROFILE_DIR = None
+PROFILING_SAMPLE_RATE = 0.1